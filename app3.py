@@ -1,17 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser, simpledialog
-from PIL import Image, ImageDraw, ImageFont, ImageTk
-import pandas as pd
+from PIL import Image, ImageDraw, ImageTk
 import os
 import json
 import base64
 from datetime import datetime
 import requests
 import webbrowser
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from PyPDF2 import PdfReader, PdfWriter
-import io
+import queue
+import threading
+from certificate_engine import (
+    DEFAULT_JPEG_QUALITY, FILE_FORMATS, IMAGE_ENCODINGS, OUTPUT_TARGETS, PAGE_SIZES,
+    CertificateEngine, JobControl, PreviewPyramid, file_signature, format_preflight, load_font,
+    load_verification_font, read_data_columns, read_data_file,
+    resolve_workers, save_layout, scale_font, summarize_results,
+    text_size,
+)
+from certificate_profile import profile_paths, profiled
+
+# Preview redraws are merged into at most one per frame (~60 fps); window
+# resizes refit the template once the resize has settled.
+REDRAW_INTERVAL_MS = 16
+RELAYOUT_DELAY_MS = 150
 
 class CertificateGenerator:
     def __init__(self, root):
@@ -24,6 +34,7 @@ class CertificateGenerator:
         self.template_path = None
         self.csv_path = None
         self.df_current = None
+        self.df_signature = None
         self.preview_row_var = tk.IntVar(value=1)
         self.canvas_scale = 1.0
         self.show_axis = tk.BooleanVar(value=True)
@@ -36,6 +47,14 @@ class CertificateGenerator:
         self.text_fields = []
         self.current_field_index = 0
         self.preview_image = None
+        # Downscaled template levels for the preview (see PreviewPyramid)
+        self.preview_pyramid = None
+        # Pending after() ids, so bursts of events collapse into one redraw
+        self._redraw_after = None
+        self._relayout_after = None
+        self._motion_after = None
+        self._last_motion = None
+        self._crosshair_lines = None
         
         # Email settings
         self.apps_script_url = ""
@@ -53,6 +72,27 @@ class CertificateGenerator:
         self.verification_position = None
         self.setting_verification_position = False
         self.verification_font_size = tk.IntVar(value=14)
+
+        # Rendering processes for generation (1 = render in the GUI process)
+        self.worker_count = tk.IntVar(value=1)
+        # PDF output: 'raster' burns text into the image, 'vector' writes real PDF text
+        self.output_mode_var = tk.StringVar(value="raster")
+        # 'files' (one PDF per row) or 'merged' (one PDF with a page per row)
+        self.output_target_var = tk.StringVar(value="files")
+        # Encoding of the written files: format, page size, resolution, embedded image
+        self.file_format_var = tk.StringVar(value="pdf")
+        self.page_size_var = tk.StringVar(value="template")
+        self.dpi_var = tk.StringVar(value="")  # empty = template resolution
+        self.image_encoding_var = tk.StringVar(value="jpeg")
+        self.jpeg_quality_var = tk.IntVar(value=DEFAULT_JPEG_QUALITY)
+        # Skip rows whose certificate in the output folder is already up to date
+        self.incremental_var = tk.BooleanVar(value=False)
+        # Profile the generation job (see certificate_profile)
+        self.profile_var = tk.BooleanVar(value=False)
+
+        # Background generation job: control switch and worker -> Tk message queue
+        self.job_control = None
+        self.job_queue = queue.Queue()
         
         self.setup_ui()
     
@@ -141,10 +181,10 @@ class CertificateGenerator:
         options_frame.pack(fill=tk.X, pady=(10, 0))
         
         ttk.Checkbutton(options_frame, text="Show Axis", variable=self.show_axis,
-                       command=self.update_display).pack(side=tk.LEFT)
+                       command=self.schedule_redraw).pack(side=tk.LEFT)
         
         ttk.Checkbutton(options_frame, text="Show Crosshair", variable=self.show_crosshair,
-                       command=self.update_display).pack(side=tk.LEFT, padx=(10, 0))
+                       command=self.schedule_redraw).pack(side=tk.LEFT, padx=(10, 0))
 
     # NEW: Separate section for verification controls (unnumbered)
     def setup_verification_section(self, parent):
@@ -187,7 +227,7 @@ class CertificateGenerator:
             self.uid_combo['values'] = self.csv_columns
 
         # Refresh preview so Verification ID overlay shows/hides immediately
-        self.update_display()
+        self.schedule_redraw()
 
     def begin_set_verification_position(self):
         if not self.enable_verification.get():
@@ -244,6 +284,46 @@ class CertificateGenerator:
         self.message_text.pack(fill=tk.X, pady=(2, 0))
         self.message_text.insert(tk.END, "Dear {Name},\n\nPlease find your certificate attached.\n\nBest regards,\nCertificate Team")
         
+        # Concurrent sends
+        parallel_frame = ttk.Frame(self.email_settings_frame)
+        parallel_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(parallel_frame, text="Parallel Sends:").pack(side=tk.LEFT)
+        self.email_parallel_var = tk.IntVar(value=4)
+        tk.Spinbox(parallel_frame, from_=1, to=32, width=5,
+                   textvariable=self.email_parallel_var).pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(parallel_frame, text="Emails per Request:").pack(side=tk.LEFT, padx=(10, 0))
+        self.email_batch_var = tk.IntVar(value=1)
+        tk.Spinbox(parallel_frame, from_=1, to=50, width=4,
+                   textvariable=self.email_batch_var).pack(side=tk.LEFT, padx=(6, 0))
+
+        # Lighter attachment rendered alongside the archival copy
+        attachment_frame = ttk.Frame(self.email_settings_frame)
+        attachment_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(attachment_frame, text="Attachment DPI:").pack(side=tk.LEFT)
+        self.attachment_dpi_var = tk.StringVar(value="")  # empty = attach the archival file
+        ttk.Entry(attachment_frame, textvariable=self.attachment_dpi_var,
+                  width=5).pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(attachment_frame, text="Quality:").pack(side=tk.LEFT, padx=(10, 0))
+        self.attachment_quality_var = tk.StringVar(value="")  # empty = EMAIL_JPEG_QUALITY
+        tk.Spinbox(attachment_frame, from_=1, to=95, width=4,
+                   textvariable=self.attachment_quality_var).pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(attachment_frame, text="(both blank = attach the full file)",
+                  foreground="gray").pack(side=tk.LEFT, padx=(6, 0))
+
+        # Sending quota of the Apps Script account
+        quota_frame = ttk.Frame(self.email_settings_frame)
+        quota_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(quota_frame, text="Daily Quota:").pack(side=tk.LEFT)
+        self.daily_quota_var = tk.StringVar(value="")  # empty = no quota
+        ttk.Entry(quota_frame, textvariable=self.daily_quota_var, width=6).pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(quota_frame, text="Per Minute:").pack(side=tk.LEFT, padx=(10, 0))
+        self.per_minute_var = tk.StringVar(value="")  # empty = as fast as possible
+        ttk.Entry(quota_frame, textvariable=self.per_minute_var, width=5).pack(side=tk.LEFT, padx=(6, 0))
+        self.wait_for_quota_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.email_settings_frame,
+                        text="Keep running until queued emails are sent (waits for the quota)",
+                        variable=self.wait_for_quota_var).pack(anchor=tk.W)
+        
         # Setup Apps Script button
         ttk.Button(self.email_settings_frame, text="Setup Google Apps Script", 
                   command=self.show_apps_script_setup).pack(pady=(10, 0))
@@ -301,31 +381,50 @@ class CertificateGenerator:
 STEP 2: Apps Script Code
 Copy and paste this code into your Google Apps Script editor:
 
+function sendCertificate(data) {
+  const { to, subject, message, attachmentData, attachmentName, attachmentMimeType } = data;
+  
+  // Decode base64 attachment
+  const blob = Utilities.newBlob(
+    Utilities.base64Decode(attachmentData), 
+    attachmentMimeType || 'application/pdf', 
+    attachmentName
+  );
+  
+  // Send email with attachment
+  GmailApp.sendEmail(to, subject, message, {
+    attachments: [blob]
+  });
+}
+
+function jsonOutput(result) {
+  return ContentService
+    .createTextOutput(JSON.stringify(result))
+    .setMimeType(ContentService.MimeType.JSON);
+}
+
 function doPost(e) {
   try {
     const data = JSON.parse(e.postData.contents);
-    const { to, subject, message, attachmentData, attachmentName } = data;
-    
-    // Decode base64 attachment
-    const blob = Utilities.newBlob(
-      Utilities.base64Decode(attachmentData), 
-      'application/pdf', 
-      attachmentName
-    );
     
-    // Send email with attachment
-    GmailApp.sendEmail(to, subject, message, {
-      attachments: [blob]
-    });
+    // Batched request: {batch: [email, ...]} -> one result per email, in order
+    if (Array.isArray(data.batch)) {
+      const results = data.batch.map(function (item) {
+        try {
+          sendCertificate(item);
+          return {success: true};
+        } catch (error) {
+          return {success: false, error: error.toString()};
+        }
+      });
+      return jsonOutput({success: true, results: results});
+    }
     
-    return ContentService
-      .createTextOutput(JSON.stringify({success: true, message: 'Email sent successfully'}))
-      .setMimeType(ContentService.MimeType.JSON);
+    sendCertificate(data);
+    return jsonOutput({success: true, message: 'Email sent successfully'});
       
   } catch (error) {
-    return ContentService
-      .createTextOutput(JSON.stringify({success: false, error: error.toString()}))
-      .setMimeType(ContentService.MimeType.JSON);
+    return jsonOutput({success: false, error: error.toString()});
   }
 }
 
@@ -346,8 +445,12 @@ STEP 4: Authorize Permissions
 
 IMPORTANT NOTES:
 - The Apps Script will send emails from your Gmail account
-- Make sure you have sufficient Gmail sending limits
+- Make sure you have sufficient Gmail sending limits (about 100 recipients a day on
+  consumer accounts, 1500 on Workspace); set "Daily Quota" to match, and emails past
+  it are queued in the output folder and sent when the quota frees up
 - Test with a small batch first
+- "Emails per Request" above 1 needs this version of the script (it accepts
+  batches); keep each request well under Apps Script's request size limit
 - The script requires Gmail API permissions to send emails
 
 STEP 5: Test Setup
@@ -473,6 +576,75 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         self.generate_button = ttk.Button(generate_frame, text="Generate All Certificates", 
                                          command=self.generate_certificates, state=tk.DISABLED)
         self.generate_button.pack(fill=tk.X)
+
+        # Run controls (active while a generation job runs in the background)
+        run_controls = ttk.Frame(generate_frame)
+        run_controls.pack(fill=tk.X, pady=(5, 0))
+        self.pause_button = ttk.Button(run_controls, text="Pause", state=tk.DISABLED,
+                                       command=self.toggle_pause_generation)
+        self.pause_button.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = ttk.Button(run_controls, text="Cancel", state=tk.DISABLED,
+                                        command=self.cancel_generation)
+        self.cancel_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+
+        # Parallel rendering
+        workers_frame = ttk.Frame(generate_frame)
+        workers_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(workers_frame, text="Worker Processes (0 = all cores):").pack(side=tk.LEFT)
+        tk.Spinbox(workers_frame, from_=0, to=64, width=5,
+                   textvariable=self.worker_count).pack(side=tk.LEFT, padx=(6, 0))
+
+        # Output mode
+        mode_frame = ttk.Frame(generate_frame)
+        mode_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(mode_frame, text="PDF Text:").pack(side=tk.LEFT)
+        ttk.Combobox(mode_frame, textvariable=self.output_mode_var, values=("raster", "vector"),
+                     width=8, state="readonly").pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(mode_frame, text="(vector = searchable, smaller)",
+                  foreground="gray").pack(side=tk.LEFT, padx=(6, 0))
+
+        # Output target
+        target_frame = ttk.Frame(generate_frame)
+        target_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(target_frame, text="Output:").pack(side=tk.LEFT)
+        ttk.Combobox(target_frame, textvariable=self.output_target_var, values=OUTPUT_TARGETS,
+                     width=8, state="readonly").pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(target_frame, text="(merged = one printable PDF, zip = one archive; no email)",
+                  foreground="gray").pack(side=tk.LEFT, padx=(6, 0))
+
+        # Output encoding
+        format_frame = ttk.Frame(generate_frame)
+        format_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(format_frame, text="Format:").pack(side=tk.LEFT)
+        ttk.Combobox(format_frame, textvariable=self.file_format_var, values=FILE_FORMATS,
+                     width=6, state="readonly").pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(format_frame, text="Page:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Combobox(format_frame, textvariable=self.page_size_var,
+                     values=("template",) + tuple(PAGE_SIZES),
+                     width=9, state="readonly").pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(format_frame, text="DPI:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(format_frame, textvariable=self.dpi_var, width=5).pack(side=tk.LEFT, padx=(6, 0))
+
+        encoding_frame = ttk.Frame(generate_frame)
+        encoding_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(encoding_frame, text="Image Encoding:").pack(side=tk.LEFT)
+        ttk.Combobox(encoding_frame, textvariable=self.image_encoding_var, values=IMAGE_ENCODINGS,
+                     width=6, state="readonly").pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(encoding_frame, text="Quality:").pack(side=tk.LEFT, padx=(10, 0))
+        tk.Spinbox(encoding_frame, from_=1, to=95, width=4,
+                   textvariable=self.jpeg_quality_var).pack(side=tk.LEFT, padx=(6, 0))
+        ttk.Label(encoding_frame, text="(flate = lossless, larger)",
+                  foreground="gray").pack(side=tk.LEFT, padx=(6, 0))
+
+        # Incremental regeneration
+        ttk.Checkbutton(generate_frame, text="Only regenerate changed rows (reuse output folder)",
+                        variable=self.incremental_var).pack(anchor=tk.W, pady=(5, 0))
+        ttk.Checkbutton(generate_frame, text="Profile this run (reports saved next to the output folder)",
+                        variable=self.profile_var).pack(anchor=tk.W)
+
+        # Save layout for headless runs
+        ttk.Button(generate_frame, text="Save Layout for CLI",
+                  command=self.save_layout).pack(fill=tk.X, pady=(5, 0))
         
         # Progress bar
         self.progress = ttk.Progressbar(generate_frame, mode='determinate')
@@ -657,13 +829,13 @@ Use the "Test Email Setup" button below to verify your configuration works corre
             # Clear link
             field['link_url'] = None
             field['link_label'].config(text="Link: None", foreground="gray")
-            self.update_display()
+            self.schedule_redraw()
             return
 
         # Store the static URL
         field['link_url'] = url
         field['link_label'].config(text=f"Link: {url}", foreground="blue")
-        self.update_display()
+        self.schedule_redraw()
     
     def update_current_field_display(self):
         if self.current_field_index < len(self.text_fields):
@@ -698,7 +870,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         }
         field['sample_text'] = sample_texts.get(new_type, 'SAMPLE TEXT')
         
-        self.update_display()
+        self.schedule_redraw()
     
     def auto_select_column(self, field):
         """Auto-select the best matching CSV column for a field type"""
@@ -744,11 +916,11 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         except ValueError:
             field['font_size'] = 50
         
-        self.update_display()
+        self.schedule_redraw()
 
     def on_preview_row_change(self):
         """Handle preview row spinbox change - update display to show new row values"""
-        self.update_display()
+        self.schedule_redraw()
     
     def choose_field_color(self, field_id):
         field = self.text_fields[field_id]
@@ -756,7 +928,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         if color:
             field['font_color'] = color
             field['color_button'].config(bg=color)
-            self.update_display()
+            self.schedule_redraw()
     
     def browse_field_font(self, field_id):
         field = self.text_fields[field_id]
@@ -766,7 +938,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         )
         if file_path:
             field['font_path'] = file_path
-            self.update_display()
+            self.schedule_redraw()
     
     def delete_field(self, field_id):
         # Remove field data
@@ -780,7 +952,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         
         # Refresh fields list
         self.refresh_fields_display()
-        self.update_display()
+        self.schedule_redraw()
         self.check_generate_ready()
     
     def clear_all_fields(self):
@@ -789,7 +961,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         self.text_fields = []
         self.current_field_index = 0
         self.update_current_field_display()
-        self.update_display()
+        self.schedule_redraw()
         self.check_generate_ready()
     
     def refresh_fields_display(self):
@@ -811,6 +983,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
             try:
                 self.template_image = Image.open(file_path)
                 self.template_path = file_path
+                self.preview_pyramid = None
                 self.template_label.config(text=os.path.basename(file_path), foreground="black")
                 self.display_template()
                 self.check_generate_ready()
@@ -825,12 +998,11 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         
         if file_path:
             try:
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                else:
-                    df = pd.read_excel(file_path)
+                df = read_data_file(file_path)
                 
                 self.csv_path = file_path
+                # Remember what was parsed so generation can reuse it if the file is unchanged
+                self.df_signature = file_signature(file_path)
                 self.csv_label.config(text=f"{os.path.basename(file_path)} ({len(df)} rows)", 
                                      foreground="black")
                 
@@ -901,7 +1073,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         canvas_height = self.canvas.winfo_height()
         
         if canvas_width <= 1 or canvas_height <= 1:
-            self.root.after(100, self.display_template)
+            self.schedule_display_template()
             return
         
         # Calculate scale
@@ -916,8 +1088,32 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         self.canvas.configure(scrollregion=(0, 0, display_width, display_height))
         
         self.update_display()
+
+    def schedule_display_template(self, delay=RELAYOUT_DELAY_MS):
+        """Refit the template to the canvas once events stop arriving for delay ms"""
+        if self._relayout_after is not None:
+            self.root.after_cancel(self._relayout_after)
+        self._relayout_after = self.root.after(delay, self._run_display_template)
+
+    def _run_display_template(self):
+        self._relayout_after = None
+        self.display_template()
+
+    def schedule_redraw(self):
+        """Redraw the preview on the next frame; repeated calls before then are merged"""
+        if self._redraw_after is None:
+            self._redraw_after = self.root.after(REDRAW_INTERVAL_MS, self._run_redraw)
+
+    def _run_redraw(self):
+        self._redraw_after = None
+        self.update_display()
     
     def update_display(self):
+        # Drawing now supersedes any redraw still queued
+        if self._redraw_after is not None:
+            self.root.after_cancel(self._redraw_after)
+            self._redraw_after = None
+
         if not self.template_image:
             return
         
@@ -926,9 +1122,12 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         display_width = int(img_width * self.canvas_scale)
         display_height = int(img_height * self.canvas_scale)
         
-        # Create preview with all text fields
-        preview = self.template_image.copy()
-        draw = ImageDraw.Draw(preview)
+        # Start from the cached downscaled template and draw only the text at
+        # display scale, so redraw cost does not depend on template resolution
+        if self.preview_pyramid is None:
+            self.preview_pyramid = PreviewPyramid(self.template_image)
+        display_preview = self.preview_pyramid.get((max(1, display_width), max(1, display_height))).copy()
+        draw = ImageDraw.Draw(display_preview)
         
         # Draw all positioned text fields
         for field in self.text_fields:
@@ -948,30 +1147,16 @@ Use the "Test Email Setup" button below to verify your configuration works corre
                 if uid_val and uid_val.lower() != "nan":
                     # Draw at original coords (centered baseline like other fields)
                     text = f"Verification ID: {uid_val}"
-                    try:
-                        vsize = max(8, int(self.verification_font_size.get()))
-                        try:
-                            font = ImageFont.truetype("arial.ttf", vsize)
-                        except Exception:
-                            font = ImageFont.load_default()
-                        bbox = draw.textbbox((0, 0), text, font=font)
-                        tw = bbox[2] - bbox[0]
-                        th = bbox[3] - bbox[1]
-                    except Exception:
-                        tw, th = draw.textsize(text, font=font)
-                    x, y = self.verification_position
-                    x_draw = x - tw // 2
-                    y_draw = y - th // 2
-                    draw.text((x_draw, y_draw), text, fill="#0000EE", font=font)
-        
-        # Resize for display
-        display_preview = preview.resize((display_width, display_height), Image.Resampling.LANCZOS)
+                    vsize = max(8, int(self.verification_font_size.get()))
+                    font = load_verification_font(vsize)
+                    self.draw_scaled_text(draw, self.verification_position, text, "#0000EE", font)
         
         # Convert to PhotoImage
         self.photo = ImageTk.PhotoImage(display_preview)
         
         # Clear canvas and draw image
         self.canvas.delete("all")
+        self._crosshair_lines = None
         self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo, tags="template")
         
         # Draw axis and guides if enabled
@@ -992,30 +1177,22 @@ Use the "Test Email Setup" button below to verify your configuration works corre
                     pass
     
     def draw_field_on_preview(self, draw, field):
-        # Load font
-        try:
-            if field['font_path']:
-                font = ImageFont.truetype(field['font_path'], field['font_size'])
-            else:
-                font = ImageFont.load_default()
-        except:
-            font = ImageFont.load_default()
-        
-        # Get text size
-        text = field['sample_text']
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        except AttributeError:
-            text_width, text_height = draw.textsize(text, font=font)
+        # Load font (cached, shared with the batch engine)
+        font = load_font(field['font_path'], field['font_size'])
+        self.draw_scaled_text(draw, field['position'], field['sample_text'], field['font_color'], font)
+
+    def draw_scaled_text(self, draw, position, text, fill, font):
+        """Draw text centered at an original-image position onto the display-size preview"""
+        # Measure at full size so placement matches the generated certificate
+        text_width, text_height = text_size(draw, text, font)
         
         # Calculate position (center text at clicked position)
-        x = field['position'][0] - text_width // 2
-        y = field['position'][1] - text_height // 2
+        x = position[0] - text_width // 2
+        y = position[1] - text_height // 2
         
-        # Draw text
-        draw.text((x, y), text, fill=field['font_color'], font=font)
+        # Draw text at display scale
+        scale = self.canvas_scale
+        draw.text((x * scale, y * scale), text, fill=fill, font=scale_font(font, scale))
     
     def draw_axis(self):
         canvas_width = self.canvas.winfo_width()
@@ -1097,7 +1274,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
             self.verification_position = (orig_x, orig_y)
             self.setting_verification_position = False
             messagebox.showinfo("Verification", f"Verification ID position set at ({orig_x}, {orig_y})")
-            self.update_display()
+            self.schedule_redraw()
             return
         
         if self.current_field_index >= len(self.text_fields):
@@ -1118,31 +1295,51 @@ Use the "Test Email Setup" button below to verify your configuration works corre
             field['pos_label'].config(text=f"Position: ({orig_x}, {orig_y})", 
                                     foreground="green")
             
-            self.update_display()
+            self.schedule_redraw()
             self.check_generate_ready()
     
     def on_mouse_move(self, event):
         if not self.template_image:
             return
         
+        # Only the latest position matters; handle it once per frame
+        self._last_motion = (event.x, event.y)
+        if self._motion_after is None:
+            self._motion_after = self.root.after(REDRAW_INTERVAL_MS, self._apply_mouse_move)
+
+    def _apply_mouse_move(self):
+        self._motion_after = None
+        if not self.template_image or self._last_motion is None:
+            return
+        x, y = self._last_motion
+
         # Convert to original coordinates
-        orig_x = int(event.x / self.canvas_scale)
-        orig_y = int(event.y / self.canvas_scale)
+        orig_x = int(x / self.canvas_scale)
+        orig_y = int(y / self.canvas_scale)
         
-        self.coords_label.config(text=f"Mouse Position: ({orig_x}, {orig_y})")
+        coords_text = f"Mouse Position: ({orig_x}, {orig_y})"
+        if self.coords_label.cget("text") != coords_text:
+            self.coords_label.config(text=coords_text)
         
         # Draw crosshair if enabled
         if self.show_crosshair.get():
-            self.canvas.delete("crosshair")
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
-            
-            # Vertical line
-            self.canvas.create_line(event.x, 0, event.x, canvas_height, 
-                                  fill="red", width=1, tags="crosshair")
-            # Horizontal line
-            self.canvas.create_line(0, event.y, canvas_width, event.y, 
-                                  fill="red", width=1, tags="crosshair")
+            if self._crosshair_lines is None:
+                # Vertical and horizontal line, created once and then moved
+                self._crosshair_lines = (
+                    self.canvas.create_line(x, 0, x, canvas_height,
+                                            fill="red", width=1, tags="crosshair"),
+                    self.canvas.create_line(0, y, canvas_width, y,
+                                            fill="red", width=1, tags="crosshair"),
+                )
+            else:
+                vertical, horizontal = self._crosshair_lines
+                self.canvas.coords(vertical, x, 0, x, canvas_height)
+                self.canvas.coords(horizontal, 0, y, canvas_width, y)
+        elif self._crosshair_lines is not None:
+            self.canvas.delete("crosshair")
+            self._crosshair_lines = None
     
     def on_mouse_wheel(self, event):
         # Zoom functionality
@@ -1150,7 +1347,7 @@ Use the "Test Email Setup" button below to verify your configuration works corre
             zoom_factor = 1.1 if event.delta > 0 else 0.9
             self.canvas_scale *= zoom_factor
             self.canvas_scale = max(0.1, min(3.0, self.canvas_scale))  # Limit zoom
-            self.update_display()
+            self.schedule_redraw()
         else:
             # Normal scrolling
             self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -1168,6 +1365,10 @@ Use the "Test Email Setup" button below to verify your configuration works corre
                           self.email_column_var.get())
             ready = ready and email_ready
         
+        # Never re-enable while a job is running in the background
+        if self.job_control is not None:
+            ready = False
+        
         self.generate_button.config(state=tk.NORMAL if ready else tk.DISABLED)
     
     def ask_output_folder(self):
@@ -1179,158 +1380,73 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         )
         return folder_name
     
-    def _add_pdf_links(self, input_pdf, output_pdf, links_to_add, image_size):
-        """Add clickable hyperlinks to PDF using ReportLab overlay.
-        
-        links_to_add: list of dicts with 'position', 'text', 'url'
-        image_size: (width, height) of the certificate image
-        """
-        try:
-            # Create overlay PDF with clickable rectangles
-            packet = io.BytesIO()
-            c = canvas.Canvas(packet, pagesize=(image_size[0], image_size[1]))
-            
-            # Add invisible clickable rectangles for each link
-            for link_info in links_to_add:
-                x, y = link_info['position']
-                url = link_info['url']
-                # Determine clickable area based on font size (if provided)
-                fsize = int(link_info.get('font_size', 12))
-                rect_width = max(80, fsize * 6)
-                rect_height = max(12, int(fsize * 1.6))
-
-                # ReportLab origin is bottom-left while image coords origin is top-left.
-                # Convert Y coordinate accordingly.
-                page_w, page_h = image_size[0], image_size[1]
-                # link_info position is (x,y) in image coords (top-left origin)
-                # compute rect in PDF coordinates (bottom-left origin)
-                x1 = x - rect_width // 2
-                x2 = x + rect_width // 2
-                # top of rect in image coords = y - rect_height//2
-                y_top = y - rect_height // 2
-                y_bottom = y + rect_height // 2
-                # convert to PDF coords
-                py1 = page_h - y_bottom
-                py2 = page_h - y_top
-                rect = (float(x1), float(py1), float(x2), float(py2))
-
-                # Add the clickable link rectangle
-                c.linkURL(url, rect, relative=0, thickness=0)
-            
-            c.showPage()
-            c.save()
-            packet.seek(0)
-            
-            # Read the original PDF
-            reader = PdfReader(input_pdf)
-            writer = PdfWriter()
-            
-            # Get first page and merge with overlay
-            if len(reader.pages) > 0:
-                first_page = reader.pages[0]
-                overlay_pdf = PdfReader(packet)
-                overlay_page = overlay_pdf.pages[0]
-                first_page.merge_page(overlay_page)
-            
-            # Add all pages to writer
-            for page in reader.pages:
-                writer.add_page(page)
-            
-            # Write output PDF
-            with open(output_pdf, 'wb') as f:
-                writer.write(f)
-            
-            # Clean up temp file
-            if os.path.exists(input_pdf):
-                os.remove(input_pdf)
-                
-        except Exception as e:
-            print(f"Error adding PDF links: {e}")
-            # Fallback: just copy input to output
-            if os.path.exists(input_pdf):
-                os.rename(input_pdf, output_pdf)
-    
-    def send_email_with_certificate(self, email, subject, message, pdf_path, recipient_name=""):
-        """Send email with certificate attachment using Google Apps Script"""
-        try:
-            url = self.url_entry.get().strip()
-            if not url:
-                return False, "Apps Script URL not configured"
-
-            # Read PDF file and encode to base64
-            with open(pdf_path, 'rb') as f:
-                pdf_data = f.read()
-
-            attachment_data = base64.b64encode(pdf_data).decode('utf-8')
-            attachment_name = os.path.basename(pdf_path)
-
-            # Replace placeholders in message
-            personalized_message = message.replace("{Name}", recipient_name)
+    def get_attachment_quality(self):
+        """JPEG quality of the email attachment, or None if left blank"""
+        quality = self.attachment_quality_var.get().strip()
+        if not quality:
+            return None
+        if not quality.isdigit() or not 1 <= int(quality) <= 95:
+            raise ValueError("Attachment quality must be a whole number from 1 to 95")
+        return int(quality)
 
-            # Prepare email data
-            email_data = {
-                'to': email,
-                'subject': subject,
-                'message': personalized_message,
-                'attachmentData': attachment_data,
-                'attachmentName': attachment_name
-            }
-
-            # Send request with timeout
-            response = requests.post(url, json=email_data, timeout=30)
-
-            # Save full response for diagnostics
-            try:
-                resp_text = response.text
-            except Exception:
-                resp_text = '<no response body>'
-
-            log_path = os.path.join(os.getcwd(), 'last_apps_script_response.txt')
-            try:
-                with open(log_path, 'w', encoding='utf-8') as lf:
-                    lf.write(f'Status: {response.status_code}\n')
-                    lf.write('Headers:\n')
-                    for k, v in response.headers.items():
-                        lf.write(f'{k}: {v}\n')
-                    lf.write('\nBody:\n')
-                    lf.write(resp_text)
-            except Exception:
-                # ignore logging errors
-                log_path = None
+    def get_layout(self):
+        """Snapshot of the current template, fields, verification and email settings"""
+        return {
+            'template_path': self.template_path,
+            'text_fields': self.text_fields,
+            'verification': {
+                'enabled': self.enable_verification.get(),
+                'uid_column': self.uid_column_var.get(),
+                'position': self.verification_position,
+                'font_size': int(self.verification_font_size.get()),
+            },
+            'email': {
+                'enabled': self.send_email.get(),
+                'apps_script_url': self.url_entry.get().strip(),
+                'email_column': self.email_column_var.get(),
+                'subject': self.subject_entry.get(),
+                'message': self.message_text.get("1.0", tk.END).strip(),
+                'max_in_flight': int(self.email_parallel_var.get()),
+                'batch_size': int(self.email_batch_var.get()),
+                'daily_quota': (int(self.daily_quota_var.get())
+                                if self.daily_quota_var.get().strip().isdigit() else None),
+                'per_minute': (int(self.per_minute_var.get())
+                               if self.per_minute_var.get().strip().isdigit() else None),
+                'wait_for_quota': self.wait_for_quota_var.get(),
+                'attachment_dpi': (int(self.attachment_dpi_var.get())
+                                   if self.attachment_dpi_var.get().strip().isdigit() else None),
+                'attachment_quality': self.get_attachment_quality(),
+            },
+            'output': {
+                'mode': self.output_mode_var.get(),
+                'target': self.output_target_var.get(),
+                'file_format': self.file_format_var.get(),
+                'page_size': self.page_size_var.get(),
+                'dpi': int(self.dpi_var.get()) if self.dpi_var.get().strip().isdigit() else None,
+                'image_encoding': self.image_encoding_var.get(),
+                'jpeg_quality': int(self.jpeg_quality_var.get()),
+            },
+        }
 
-            if response.status_code == 200:
-                # Try to parse JSON, fallback to raw text
-                try:
-                    result = response.json()
-                except Exception:
-                    result = None
+    def save_layout(self):
+        """Save the current layout as JSON for headless runs (certificate_cli.py)"""
+        if not self.template_path:
+            messagebox.showerror("Error", "Please select a template first")
+            return
 
-                if isinstance(result, dict) and result.get('success'):
-                    return True, 'Email sent successfully'
-                else:
-                    err_msg = 'Apps Script returned error'
-                    if result and isinstance(result, dict):
-                        err_msg = result.get('error', err_msg)
-                    else:
-                        # Use raw text if JSON not returned
-                        err_msg = resp_text[:1000]
-
-                    if log_path:
-                        messagebox.showerror('Email Error', f"Failed to send email. Server response saved to:\n{log_path}")
-                    else:
-                        messagebox.showerror('Email Error', f"Failed to send email. Server response:\n{err_msg}")
-
-                    return False, err_msg
-            else:
-                err_msg = f'HTTP Error {response.status_code}'
-                if log_path:
-                    messagebox.showerror('Email HTTP Error', f"{err_msg}. Full response saved to:\n{log_path}")
-                else:
-                    messagebox.showerror('Email HTTP Error', err_msg)
-                return False, f"{err_msg}: {resp_text}"
+        file_path = filedialog.asksaveasfilename(
+            title="Save Layout",
+            defaultextension=".json",
+            filetypes=[("Layout files", "*.json")]
+        )
+        if not file_path:
+            return
 
+        try:
+            save_layout(self.get_layout(), file_path)
+            messagebox.showinfo("Layout Saved", f"Layout saved to:\n{file_path}")
         except Exception as e:
-            return False, str(e)
+            messagebox.showerror("Error", f"Failed to save layout: {str(e)}")
     
     def generate_certificates(self):
         if not self.text_fields:
@@ -1342,267 +1458,144 @@ Use the "Test Email Setup" button below to verify your configuration works corre
         if not output_folder:
             return
         
+        # Read every Tk setting here, on the Tk thread; the job only sees plain data
+        try:
+            engine = CertificateEngine(self.get_layout(), self.template_image)
+            workers = resolve_workers(int(self.worker_count.get()))
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Error", f"Invalid generation settings: {str(e)}")
+            return
+
+        # Reuse the preview's copy of the data if the file is unchanged on disk
+        df = None
+        if self.df_current is not None and file_signature(self.csv_path) == self.df_signature:
+            df = self.df_current
+        
+        self.job_control = JobControl()
+        self.generate_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.NORMAL, text="Pause")
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress.config(value=0)
+        self.status_label.config(text="Starting...")
+
+        threading.Thread(
+            target=self._run_generation_job,
+            args=(engine, df, self.csv_path, output_folder, workers, self.job_control,
+                  self.incremental_var.get(), self.profile_var.get()),
+            daemon=True,
+        ).start()
+        self.root.after(100, self._poll_generation_job)
+
+    def _run_generation_job(self, engine, df, csv_path, output_folder, workers, control,
+                            incremental=False, profile=False):
+        """Background thread: load data and run the engine, reporting through job_queue.
+
+        Touches no Tk objects; errors end up in the final summary, never in dialogs.
+        """
         try:
             # Load CSV data
-            if self.csv_path.endswith('.csv'):
-                df = pd.read_csv(self.csv_path)
-            else:
-                df = pd.read_excel(self.csv_path)
+            if df is None:
+                columns = read_data_columns(csv_path)
+                df = read_data_file(csv_path, usecols=engine.referenced_columns(columns))
             
             # Validate CSV columns
-            missing_columns = []
-            for field in self.text_fields:
-                if field['csv_column'] not in df.columns:
-                    missing_columns.append(field['csv_column'])
-            
-            # Check email column if email is enabled
-            if self.send_email.get():
-                email_column = self.email_column_var.get()
-                if email_column not in df.columns:
-                    missing_columns.append(f"{email_column} (email)")
-            
+            missing_columns = engine.missing_columns(df.columns)
             if missing_columns:
-                messagebox.showerror("Error", 
-                                   f"Missing CSV columns: {', '.join(missing_columns)}")
+                self.job_queue.put(('error', f"Missing CSV columns: {', '.join(missing_columns)}"))
                 return
-            
-            # Create output folder
-            os.makedirs(output_folder, exist_ok=True)
-            
-            # Setup progress
-            self.progress.config(maximum=len(df))
-            self.progress.config(value=0)
-            
-            generated_files = []
-            email_results = {"sent": 0, "failed": 0, "errors": []}
-            
-            # Get email settings if enabled
-            if self.send_email.get():
-                email_column = self.email_column_var.get()
-                email_subject = self.subject_entry.get()
-                email_message = self.message_text.get("1.0", tk.END).strip()
-            
-            # Generate certificates
-            for index, row in df.iterrows():
-                # Create certificate
-                certificate = self.template_image.copy()
-                draw = ImageDraw.Draw(certificate)
-                
-                # Draw all text fields
-                name_parts = []
-                recipient_name = ""
-                
-                for field in self.text_fields:
-                    # Get data from CSV
-                    field_value = str(row[field['csv_column']]).strip()
-                    if pd.isna(row[field['csv_column']]) or not field_value:
-                        field_value = "N/A"
-                    
-                    # Store name for filename and email personalization
-                    if field['type'].lower() == 'name':
-                        name_parts.append(field_value)
-                        recipient_name = field_value
-                    
-                    # Load font
-                    try:
-                        if field['font_path']:
-                            font = ImageFont.truetype(field['font_path'], field['font_size'])
-                        else:
-                            font = ImageFont.load_default()
-                    except:
-                        font = ImageFont.load_default()
-                    
-                    # Calculate text position (center at clicked position)
-                    try:
-                        bbox = draw.textbbox((0, 0), field_value, font=font)
-                        text_width = bbox[2] - bbox[0]
-                        text_height = bbox[3] - bbox[1]
-                    except AttributeError:
-                        text_width, text_height = draw.textsize(field_value, font=font)
-                    
-                    text_x = field['position'][0] - text_width // 2
-                    text_y = field['position'][1] - text_height // 2
-                    
-                    # Draw text
-                    draw.text((text_x, text_y), field_value, 
-                             fill=field['font_color'], font=font)
-
-                # If any fields have links, render them as visible text on certificate (blue)
-                for link_field in self.text_fields:
-                    if link_field.get('link_url') and link_field.get('position'):
-                        try:
-                            ffont = ImageFont.truetype(link_field['font_path'], max(12, int(link_field.get('font_size', 12) * 0.6))) if link_field.get('font_path') else ImageFont.load_default()
-                        except:
-                            ffont = ImageFont.load_default()
-                        
-                        # Display text is the field value from CSV
-                        if link_field['csv_column'] in df.columns:
-                            try:
-                                link_display_text = str(row[link_field['csv_column']])
-                            except Exception:
-                                link_display_text = ''
-                        else:
-                            link_display_text = ''
+            df = df[engine.referenced_columns(df.columns)]
 
-                        if link_display_text:
-                            try:
-                                bbox = draw.textbbox((0,0), link_display_text, font=ffont)
-                                tw = bbox[2]-bbox[0]
-                                th = bbox[3]-bbox[1]
-                            except AttributeError:
-                                tw, th = draw.textsize(link_display_text, font=ffont)
-                            lx = link_field['position'][0] - tw // 2
-                            ly = link_field['position'][1] + int(th * 0.8)
-                            # Draw in blue to indicate it's a link
-                            draw.text((lx, ly), link_display_text, fill="#0000EE", font=ffont)
-
-                # NEW: Draw verification text and add clickable link to PDF
-                added_verification_link = False
-                if self.enable_verification.get() and self.verification_position:
-                    uid_col = self.uid_column_var.get()
-                    if uid_col in df.columns:
-                        uid_val = str(row[uid_col]).strip()
-                        if uid_val and uid_val.lower() != "nan":
-                            # Draw visible text in blue using configurable font size
-                            vtext = f"Verification ID: {uid_val}"
-                            vsize = max(8, int(self.verification_font_size.get()))
-                            try:
-                                # Prefer Arial if available, otherwise fallback to default
-                                try:
-                                    fontv = ImageFont.truetype("arial.ttf", vsize)
-                                except Exception:
-                                    fontv = ImageFont.load_default()
-
-                                bbox = draw.textbbox((0,0), vtext, font=fontv)
-                                tw = bbox[2]-bbox[0]
-                                th = bbox[3]-bbox[1]
-                            except Exception:
-                                tw, th = draw.textsize(vtext, font=fontv)
-                            vx = self.verification_position[0] - tw // 2
-                            vy = self.verification_position[1] - th // 2
-                            draw.text((vx, vy), vtext, fill="#0000EE", font=fontv)
-                            added_verification_link = True
-
-                # Create filename
-                if name_parts:
-                    filename_base = "_".join(name_parts)
-                else:
-                    # Use first column value if no name field
-                    filename_base = str(row.iloc[0])
-                
-                # Sanitize filename
-                sanitized_name = "".join(c for c in filename_base if c.isalnum() or c in (" ", "_")).replace(" ", "_")
-                sanitized_name = sanitized_name[:50]  # Limit length
-                
-                # Save as PDF
-                pdf_filename = f"{sanitized_name}_{index+1}.pdf"
-                pdf_path = os.path.join(output_folder, pdf_filename)
-                
-                # Save certificate image as temporary PDF
-                temp_pdf = pdf_path.replace(".pdf", "_temp.pdf")
-                certificate.convert("RGB").save(temp_pdf)
-                
-                # Now add clickable hyperlinks using ReportLab
-                try:
-                    # Collect all links to add
-                    links_to_add = []
-                    
-                    # Check field links
-                    for link_field in self.text_fields:
-                        if link_field.get('link_url') and link_field.get('position'):
-                            if link_field['csv_column'] in df.columns:
-                                try:
-                                    link_display_text = str(row[link_field['csv_column']])
-                                except Exception:
-                                    link_display_text = ''
-                            else:
-                                link_display_text = ''
-                            
-                            if link_display_text:
-                                # Store link info: (position, text, url)
-                                links_to_add.append({
-                                    'position': link_field['position'],
-                                    'text': link_display_text,
-                                    'url': link_field['link_url'],
-                                    'font_size': int(link_field.get('font_size', 12))
-                                })
-                    
-                    # Check verification link
-                    verify_url = None
-                    if self.enable_verification.get() and self.verification_position:
-                        uid_col = self.uid_column_var.get()
-                        if uid_col in df.columns:
-                            uid_val = str(row[uid_col]).strip()
-                            if uid_val and uid_val.lower() != "nan":
-                                verify_url = f"https://avishkaar.co/s3_virtual/verify.php?uid={uid_val}"
-                                links_to_add.append({
-                                    'position': self.verification_position,
-                                    'text': f"Verification ID: {uid_val}",
-                                    'url': verify_url,
-                                    'font_size': int(self.verification_font_size.get())
-                                })
-                    
-                    # If there are links to add, use ReportLab to overlay them
-                    if links_to_add:
-                        self._add_pdf_links(temp_pdf, pdf_path, links_to_add, certificate.size)
-                    else:
-                        # No links, just copy temp to final
-                        os.rename(temp_pdf, pdf_path)
-                    
-                except Exception as e:
-                    print(f"Warning: Failed to add hyperlinks: {e}")
-                    # Fall back to temp file as final
-                    if os.path.exists(temp_pdf):
-                        os.rename(temp_pdf, pdf_path)
+            # Pre-flight check: let the user decide before anything is rendered
+            preflight_text = format_preflight(engine.preflight(df))
+            if preflight_text:
+                reply = {'event': threading.Event(), 'proceed': False}
+                self.job_queue.put(('preflight', preflight_text, reply))
+                reply['event'].wait()
+                if not reply['proceed']:
+                    self.job_queue.put(('error', "Generation cancelled after the pre-flight check"))
+                    return
 
-                generated_files.append(pdf_path)
-                
-                # Send email if enabled (UNCHANGED)
-                if self.send_email.get():
-                    recipient_email = str(row[email_column]).strip()
-                    if recipient_email and '@' in recipient_email:
-                        success, error_msg = self.send_email_with_certificate(
-                            recipient_email, email_subject, email_message, 
-                            pdf_path, recipient_name
-                        )
-                        
-                        if success:
-                            email_results["sent"] += 1
-                        else:
-                            email_results["failed"] += 1
-                            email_results["errors"].append(f"{recipient_name} ({recipient_email}): {error_msg}")
-                    else:
-                        email_results["failed"] += 1
-                        email_results["errors"].append(f"{recipient_name}: Invalid email address")
-                
-                # Update progress
-                self.progress.config(value=index + 1)
-                status_text = f"Processing: {sanitized_name}"
-                if self.send_email.get():
-                    status_text += f" | Emails sent: {email_results['sent']}"
-                self.status_label.config(text=status_text)
-                self.root.update()
-            
-            # Show completion message
-            success_msg = f"Successfully generated {len(generated_files)} certificates in folder: {output_folder}"
-            
-            if self.send_email.get():
-                success_msg += f"\n\nEmail Results:\n• Sent: {email_results['sent']}\n• Failed: {email_results['failed']}"
-                
-                if email_results["errors"]:
-                    # Show first few errors
-                    error_preview = "\n".join(email_results["errors"][:5])
-                    if len(email_results["errors"]) > 5:
-                        error_preview += f"\n... and {len(email_results['errors']) - 5} more errors"
-                    success_msg += f"\n\nFirst few email errors:\n{error_preview}"
-            
-            self.status_label.config(text="Completed!")
-            messagebox.showinfo("Success", success_msg)
+            def on_progress(done, total, status_text):
+                self.job_queue.put(('progress', done, total, status_text))
             
+            # Generate certificates (profiling covers this thread only, not the Tk loop)
+            if profile:
+                with profiled(output_folder):
+                    result = engine.run(df, output_folder, progress=on_progress,
+                                        workers=1, control=control, incremental=incremental)
+            else:
+                result = engine.run(df, output_folder, progress=on_progress,
+                                    workers=workers, control=control, incremental=incremental)
+            summary = summarize_results(result, output_folder, engine.email_enabled)
+            if profile:
+                summary += "\n\nProfile saved to:\n" + "\n".join(profile_paths(output_folder))
+            self.job_queue.put(('done', summary, result['cancelled']))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate certificates: {str(e)}")
-        finally:
-            self.progress.config(value=0)
+            self.job_queue.put(('error', f"Failed to generate certificates: {str(e)}"))
+
+    def _poll_generation_job(self):
+        """Drain job_queue on the Tk thread; reschedules itself until the job ends"""
+        finished = None
+        latest = None
+        try:
+            while True:
+                message = self.job_queue.get_nowait()
+                if message[0] == 'progress':
+                    latest = message
+                elif message[0] == 'preflight':
+                    _, preflight_text, reply = message
+                    reply['proceed'] = messagebox.askyesno(
+                        "Pre-flight Check", f"{preflight_text}\n\nGenerate certificates anyway?")
+                    reply['event'].set()
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
+
+        # Only the most recent progress update matters for the display
+        if latest:
+            _, done, total, status_text = latest
+            self.progress.config(maximum=total or done, value=done)
+            if self.job_control is not None and self.job_control.paused:
+                status_text = f"Paused | {status_text}"
+            self.status_label.config(text=status_text)
+
+        if finished is None:
+            self.root.after(100, self._poll_generation_job)
+            return
+
+        self.job_control = None
+        self.pause_button.config(state=tk.DISABLED, text="Pause")
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress.config(value=0)
+        self.check_generate_ready()
+
+        if finished[0] == 'error':
+            self.status_label.config(text="Failed")
+            messagebox.showerror("Error", finished[1])
+        else:
+            _, summary, cancelled = finished
+            self.status_label.config(text="Cancelled" if cancelled else "Completed!")
+            messagebox.showinfo("Cancelled" if cancelled else "Success", summary)
+
+    def toggle_pause_generation(self):
+        if self.job_control is None:
+            return
+        if self.job_control.paused:
+            self.job_control.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.job_control.pause()
+            self.pause_button.config(text="Resume")
+            self.status_label.config(text="Paused")
+
+    def cancel_generation(self):
+        if self.job_control is None:
+            return
+        self.job_control.cancel()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Cancelling...")
 
 def main():
     root = tk.Tk()
@@ -1611,7 +1604,7 @@ def main():
     # Handle window resize
     def on_window_resize(event):
         if event.widget == root:
-            root.after(100, app.display_template)
+            app.schedule_display_template()
     
     root.bind('<Configure>', on_window_resize)
     
@@ -0,0 +1,263 @@
+"""Benchmarks for the certificate pipeline.
+
+Synthesizes templates and rosters, runs the headless engine over them and
+writes one JSON report, so runs can be compared over time:
+
+    python certificate_bench.py -o bench.json
+    python certificate_bench.py --rows 1000 10000 100000 --templates large-rgb
+
+Each scenario runs in a fresh process so its peak RSS is its own. Emails go
+to a local stub of the Apps Script endpoint that accepts every request.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+
+import pandas as pd
+from PIL import Image
+
+from certificate_engine import CertificateEngine, iter_data_file, resolve_workers
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# name -> (size, mode); large is A4 landscape at 300 dpi
+TEMPLATES = {
+    'small-rgb': ((1240, 877), 'RGB'),
+    'small-rgba': ((1240, 877), 'RGBA'),
+    'large-rgb': ((3508, 2480), 'RGB'),
+    'large-rgba': ((3508, 2480), 'RGBA'),
+}
+
+# name -> (links, verification, email)
+FEATURES = {
+    'plain': (False, False, False),
+    'links': (True, False, False),
+    'links+verification': (True, True, False),
+    'links+verification+email': (True, True, True),
+}
+
+
+def make_template(path, size, mode):
+    """A template with smooth shading and a border, roughly like a scanned certificate"""
+    width, height = size
+    shade = Image.radial_gradient('L').resize(size)
+    image = Image.merge('RGB', (shade, Image.linear_gradient('L').resize(size),
+                                shade.transpose(Image.Transpose.ROTATE_180)))
+    border = max(4, width // 100)
+    image.paste((120, 90, 30), (0, 0, width, border))
+    image.paste((120, 90, 30), (0, height - border, width, height))
+    if mode == 'RGBA':
+        image.putalpha(Image.linear_gradient('L').resize(size).point(lambda v: 160 + v // 3))
+    image.save(path)
+
+
+def make_roster(path, rows):
+    """A roster where, as in real batches, most fields repeat and names and IDs do not"""
+    pd.DataFrame({
+        'Name': [f"Participant {i:06d}" for i in range(rows)],
+        'Course': "Advanced Robotics",
+        'Date': "2026-01-15",
+        'Department': "Computer Science",
+        'UID': [f"CERT-{i:08d}" for i in range(rows)],
+        'Email': [f"participant{i}@example.com" for i in range(rows)],
+    }).to_csv(path, index=False)
+
+
+def make_layout(template_path, size, features, font_path, email_url):
+    links, verification, email = features
+    width, height = size
+    font_size = max(16, height // 20)
+    columns = ['Name', 'Course', 'Date', 'Department']
+    text_fields = []
+    for i, column in enumerate(columns):
+        text_fields.append({
+            'id': i, 'type': 'Name' if column == 'Name' else column, 'csv_column': column,
+            'font_path': font_path, 'font_size': font_size if i == 0 else font_size // 2,
+            'font_color': "#1a1a1a", 'position': (width // 2, height * (3 + i) // 10),
+            'sample_text': column,
+            'link_url': "https://example.com/course" if links and column == 'Course' else None,
+        })
+    return {
+        'template_path': template_path,
+        'text_fields': text_fields,
+        'verification': {'enabled': verification, 'uid_column': 'UID',
+                         'position': (width // 2, height * 17 // 20), 'font_size': max(8, height // 60)},
+        'email': {'enabled': email, 'apps_script_url': email_url, 'email_column': 'Email',
+                  'subject': "Your certificate", 'message': "Dear {Name}, please find attached.",
+                  'max_in_flight': 8},
+        'output': {'mode': 'raster'},
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Accepts every email like a healthy Apps Script deployment"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentiles(values):
+    """p50/p90/p99/max of values in milliseconds"""
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99),
+            'max': round(values[-1] * 1000, 3)}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * unit / (1024 * 1024), 1)
+
+
+def run_scenario(scenario, workdir, font_path, workers):
+    """Run one scenario (in its own process) and return its result dict"""
+    size, mode = TEMPLATES[scenario['template']]
+    features = FEATURES[scenario['features']]
+    rows = scenario['rows']
+
+    # Apps Script responses are logged to the working directory
+    os.chdir(workdir)
+    template_path = os.path.join(workdir, f"template_{scenario['template']}.png")
+    if not os.path.exists(template_path):
+        make_template(template_path, size, mode)
+    roster_path = os.path.join(workdir, f"roster_{rows}.csv")
+    if not os.path.exists(roster_path):
+        make_roster(roster_path, rows)
+    output_folder = os.path.join(workdir, f"out_{scenario['name']}")
+
+    server = start_stub_server() if features[2] else None
+    email_url = f"http://127.0.0.1:{server.server_address[1]}/exec" if server else ""
+    try:
+        started = time.perf_counter()
+        engine = CertificateEngine(make_layout(template_path, size, features, font_path, email_url))
+        setup_seconds = time.perf_counter() - started
+
+        row_seconds = []
+        last = [time.perf_counter()]
+
+        def on_progress(done, total, status_text):
+            now = time.perf_counter()
+            row_seconds.append(now - last[0])
+            last[0] = now
+
+        chunks = iter_data_file(roster_path, usecols=None)
+        started = time.perf_counter()
+        last[0] = started
+        result = engine.run(chunks, output_folder, progress=on_progress, workers=workers,
+                            resume=False)
+        seconds = time.perf_counter() - started
+    finally:
+        if server:
+            server.shutdown()
+
+    bytes_written = sum(os.path.getsize(path) for path in result['generated_files'])
+    return {
+        **scenario,
+        'template_size': list(size),
+        'template_mode': mode,
+        'workers': workers,
+        'setup_seconds': round(setup_seconds, 4),
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(len(result['generated_files']) / seconds, 2) if seconds else None,
+        'row_latency_ms': percentiles(row_seconds),
+        'stages': result['metrics']['stages'],
+        'bytes_per_row': bytes_written // max(1, len(result['generated_files'])),
+        'emails_sent': result['email_results']['sent'],
+        'emails_failed': result['email_results']['failed'],
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark certificate generation")
+    parser.add_argument("-o", "--output", default="certificate_bench.json",
+                        help="JSON report to write (default: certificate_bench.json)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000],
+                        help="Roster sizes to run (default: 1000; e.g. 1000 10000 100000)")
+    parser.add_argument("--templates", nargs="+", choices=sorted(TEMPLATES), default=sorted(TEMPLATES),
+                        help="Templates to run (default: all)")
+    parser.add_argument("--features", nargs="+", choices=list(FEATURES), default=list(FEATURES),
+                        help="Feature sets to run (default: all)")
+    parser.add_argument("--font", help="TrueType font for the text fields (default: Pillow's default font)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Rendering processes (default: 1, 0 = one per CPU core)")
+    parser.add_argument("--workdir", help="Keep synthesized inputs and outputs here (default: a temp folder)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workers = resolve_workers(args.workers)
+    scenarios = [
+        {'name': f"{template}_{rows}_{features}", 'template': template, 'rows': rows,
+         'features': features}
+        for rows in args.rows for template in args.templates for features in args.features
+    ]
+
+    started = datetime.now()
+    with tempfile.TemporaryDirectory(prefix="certificate_bench_") as temp_dir:
+        workdir = os.path.abspath(args.workdir or temp_dir)
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        for scenario in scenarios:
+            # A fresh process per scenario keeps peak RSS figures separate
+            with ProcessPoolExecutor(max_workers=1,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(run_scenario, scenario, workdir, args.font, workers).result()
+            results.append(result)
+            print(f"{result['name']}: {result['rows_per_sec']} rows/s, "
+                  f"p99 {result['row_latency_ms']['p99'] if result['row_latency_ms'] else '-'} ms, "
+                  f"peak RSS {result['peak_rss_mb']} MB")
+
+    report = {
+        'started': started.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
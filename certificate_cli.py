@@ -0,0 +1,202 @@
+"""Command-line entry point: run a saved layout against a CSV/XLSX roster.
+
+Usage:
+    python certificate_cli.py layout.json roster.csv -o certificates_out
+
+The layout file is written by the GUI's "Save Layout for CLI" button. No
+tkinter import happens on this path, so it runs on headless machines.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from certificate_engine import (
+    DATA_CHUNK_ROWS, FILE_FORMATS, IMAGE_ENCODINGS, OUTPUT_TARGETS, PAGE_SIZES, TEMPLATE_DPI,
+    CertificateEngine, format_preflight, iter_data_file, load_layout, read_data_columns,
+    preflight_report, resolve_workers, summarize_results,
+)
+from certificate_profile import first_rows, profile_paths, profiled
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate certificates from a saved layout")
+    parser.add_argument("layout", help="Layout JSON saved from the GUI")
+    parser.add_argument("data", nargs="?", help="CSV or XLSX roster (not needed with --send-queued)")
+    parser.add_argument("-o", "--output",
+                        default=f"certificates_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                        help="Output folder (default: certificates_<timestamp>)")
+    parser.add_argument("--template", help="Override the template image path stored in the layout")
+    parser.add_argument("--no-email", action="store_true",
+                        help="Do not send emails even if the layout enables them")
+    parser.add_argument("--mode", choices=("raster", "vector"),
+                        help="raster: text burned into the image; vector: template image "
+                             "plus searchable PDF text (default: as saved in the layout)")
+    parser.add_argument("--target", choices=OUTPUT_TARGETS,
+                        help="files: one PDF per row; merged: one PDF with a page per row, "
+                             "sharing the template; zip: one PDF per row, streamed into a ZIP "
+                             "archive (default: as saved in the layout, else files)")
+    parser.add_argument("--format", dest="file_format", choices=FILE_FORMATS,
+                        help="File written per row: pdf, or a png/jpeg/webp image without "
+                             "clickable links (default: as saved in the layout, else pdf)")
+    parser.add_argument("--page-size", choices=("template",) + tuple(PAGE_SIZES),
+                        help="PDF page size: template (one point per template pixel) or a paper "
+                             "size matched by the long side (default: as saved in the layout)")
+    parser.add_argument("--dpi", type=int,
+                        help="Render at this resolution, downsampling the template once per job "
+                             "(default: the template's full resolution). With --page-size "
+                             "template the page takes the template's physical size from the "
+                             f"DPI in its file, or {TEMPLATE_DPI} DPI if it records none")
+    parser.add_argument("--image-encoding", choices=IMAGE_ENCODINGS,
+                        help="Image inside the PDF: jpeg (lossy, small) or flate (lossless)")
+    parser.add_argument("--jpeg-quality", type=int, metavar="1-95",
+                        help="JPEG/WebP quality (default: 75)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Rendering processes (default: 1, 0 = one per CPU core)")
+    parser.add_argument("--email-concurrency", type=int,
+                        help="Emails in flight at once (default: 4)")
+    parser.add_argument("--email-batch", type=int, metavar="N",
+                        help="Send up to N emails per request to the Apps Script (needs the "
+                             "batch-aware script from the GUI's setup guide; default: 1)")
+    parser.add_argument("--daily-quota", type=int, metavar="N",
+                        help="Email at most N recipients per rolling day (the Apps Script "
+                             "account's quota); the rest stay queued in the output folder")
+    parser.add_argument("--per-minute", type=float, metavar="N",
+                        help="Send at most N emails per minute")
+    parser.add_argument("--wait-for-quota", action="store_true",
+                        help="Keep running until queued emails are sent, waiting for the "
+                             "quota to free up as often as needed")
+    parser.add_argument("--send-queued", action="store_true",
+                        help="Only send the emails an earlier run queued in the output folder")
+    parser.add_argument("--email-dpi", type=int,
+                        help="Attach a lighter copy, downsampled to this DPI, to emails (a "
+                             "template page is sized by the DPI in its file, or "
+                             f"{TEMPLATE_DPI} DPI if it records none); it is written to the "
+                             "output folder's email/ subfolder and the archival files are "
+                             "unchanged")
+    parser.add_argument("--email-quality", type=int, metavar="1-95",
+                        help="JPEG quality of the emailed copy (default: 50 when --email-dpi is set)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only render (and email) rows whose data, layout or template "
+                             "changed since the certificates already in the output folder")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the job journal in the output folder and redo every row")
+    parser.add_argument("--chunk-rows", type=int, default=DATA_CHUNK_ROWS,
+                        help=f"Rows read from the roster at a time (default: {DATA_CHUNK_ROWS})")
+    parser.add_argument("--prometheus", metavar="PATH",
+                        help="Keep a Prometheus text-format metrics file at PATH updated during the "
+                             "run (the JSON summary is always saved in the output folder)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run with cProfile and tracemalloc; reports are written "
+                             "next to the output folder (renders in-process)")
+    parser.add_argument("--profile-rows", type=int, metavar="N",
+                        help="With --profile, only generate the first N rows")
+    parser.add_argument("--check", action="store_true",
+                        help="Only run the pre-flight check of the roster and exit (otherwise "
+                             "rows are checked as they are rendered and problems are reported "
+                             "at the end)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the final summary")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    layout = load_layout(args.layout)
+    if args.template:
+        layout['template_path'] = args.template
+    if args.mode:
+        layout['output']['mode'] = args.mode
+    if args.target:
+        layout['output']['target'] = args.target
+    for key in ('file_format', 'page_size', 'dpi', 'image_encoding', 'jpeg_quality'):
+        if getattr(args, key) is not None:
+            layout['output'][key] = getattr(args, key)
+    for key in ('daily_quota', 'per_minute'):
+        if getattr(args, key):
+            layout['email'][key] = getattr(args, key)
+    if args.wait_for_quota:
+        layout['email']['wait_for_quota'] = True
+    if args.email_batch:
+        layout['email']['batch_size'] = args.email_batch
+    if args.email_dpi:
+        layout['email']['attachment_dpi'] = args.email_dpi
+    if args.email_quality:
+        layout['email']['attachment_quality'] = args.email_quality
+    if args.email_concurrency:
+        layout['email']['max_in_flight'] = args.email_concurrency
+    if args.no_email:
+        layout['email']['enabled'] = False
+
+    engine = CertificateEngine(layout)
+    if args.send_queued:
+        if not engine.email_enabled:
+            print("Error: Email is not enabled in the layout", file=sys.stderr)
+            return 1
+        email_results = engine.send_queued(
+            args.output, progress=None if args.quiet else lambda done, total, text: print(text))
+        print(f"Sent: {email_results['sent']}, failed: {email_results['failed']}, "
+              f"still queued: {email_results['queued']}")
+        for error in email_results['errors'][:5]:
+            print(error, file=sys.stderr)
+        return 0
+    if not args.data:
+        print("Error: A CSV or XLSX roster is required", file=sys.stderr)
+        return 1
+    columns = read_data_columns(args.data)
+
+    if engine.output_target != 'files' and engine.email_enabled:
+        print("Error: Emailing certificates needs one file per recipient; "
+              "use --target files or --no-email", file=sys.stderr)
+        return 1
+    if engine.output_target == 'merged' and engine.file_format != 'pdf':
+        print("Error: The merged target writes a PDF; use --target files or zip "
+              "for image files", file=sys.stderr)
+        return 1
+
+    missing_columns = engine.missing_columns(columns)
+    if missing_columns:
+        print(f"Error: Missing CSV columns: {', '.join(missing_columns)}", file=sys.stderr)
+        return 1
+
+    usecols = engine.referenced_columns(columns)
+    if args.check:
+        report = engine.preflight(iter_data_file(args.data, usecols=usecols,
+                                                 chunksize=args.chunk_rows))
+        print(format_preflight(report)
+              or f"Pre-flight check of {report['rows']} rows: no problems found")
+        return 0
+
+    def on_progress(done, total, status_text):
+        print(f"[{done}] {status_text}")
+
+    # Stream only the referenced columns; rows are checked and rendered as they are read
+    chunks = iter_data_file(args.data, usecols=usecols, chunksize=args.chunk_rows)
+    workers = resolve_workers(args.workers)
+    if args.profile:
+        # Rendering processes are invisible to the profiler
+        workers = 1
+        chunks = first_rows(chunks, args.profile_rows)
+    report = preflight_report()
+    chunks = engine.checked_chunks(chunks, report)
+
+    def generate():
+        return engine.run(chunks, args.output, progress=None if args.quiet else on_progress,
+                          workers=workers, resume=not args.restart,
+                          incremental=args.incremental, prometheus_path=args.prometheus)
+
+    if args.profile:
+        with profiled(args.output):
+            result = generate()
+    else:
+        result = generate()
+    preflight_text = format_preflight(report)
+    if preflight_text:
+        print(preflight_text, file=sys.stderr)
+    print(summarize_results(result, args.output, engine.email_enabled))
+    if args.profile:
+        print("Profile written to: " + ", ".join(profile_paths(args.output)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
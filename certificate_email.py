@@ -0,0 +1,346 @@
+"""Sending certificates through the Google Apps Script web app.
+
+EmailDispatcher sends certificate emails concurrently over a pooled
+requests.Session, retrying with exponential backoff the failures that mean
+the script never ran (see RETRY_STATUSES), and keeps one result record per
+recipient.
+
+With batching, several emails go in one POST, {"batch": [payload, ...]},
+and the script answers {"success": true, "results": [{"success": ...,
+"error": ...}, ...]} in the same order (see parse_batch_response). One round
+trip and one script start then serve the whole batch.
+"""
+import os
+import time
+import base64
+import mimetypes
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+RESPONSE_LOG = 'last_apps_script_response.txt'
+
+# HTTP statuses worth retrying: throttled, or turned away before the script ran.
+# The POST is not idempotent: any other failure (a 500, a 504 or a read timeout)
+# may come after GmailApp already sent the email, and a retry would send it again.
+RETRY_STATUSES = {429, 503}
+
+# Cap on the attachments (base64) in one batched POST
+MAX_BATCH_BYTES = 10 * 1024 * 1024
+
+_log_lock = threading.Lock()
+
+
+def build_email_payload(email, subject, message, pdf_path, recipient_name=""):
+    """JSON body expected by the Apps Script doPost handler"""
+    # Read PDF file and encode to base64
+    with open(pdf_path, 'rb') as f:
+        pdf_data = f.read()
+
+    return {
+        'to': email,
+        'subject': subject,
+        # Replace placeholders in message
+        'message': message.replace("{Name}", recipient_name),
+        'attachmentData': base64.b64encode(pdf_data).decode('utf-8'),
+        'attachmentName': os.path.basename(pdf_path),
+        'attachmentMimeType': mimetypes.guess_type(pdf_path)[0] or 'application/pdf',
+    }
+
+
+def log_response(response):
+    """Save the full server response for diagnostics; returns the log path or None"""
+    try:
+        resp_text = response.text
+    except Exception:
+        resp_text = '<no response body>'
+
+    log_path = os.path.join(os.getcwd(), RESPONSE_LOG)
+    try:
+        with _log_lock, open(log_path, 'w', encoding='utf-8') as lf:
+            lf.write(f'Status: {response.status_code}\n')
+            lf.write('Headers:\n')
+            for k, v in response.headers.items():
+                lf.write(f'{k}: {v}\n')
+            lf.write('\nBody:\n')
+            lf.write(resp_text)
+    except Exception:
+        # ignore logging errors
+        return None
+    return log_path
+
+
+def parse_response(response):
+    """Interpret an Apps Script response as (success, message)"""
+    try:
+        resp_text = response.text
+    except Exception:
+        resp_text = '<no response body>'
+
+    if response.status_code != 200:
+        return False, f"HTTP Error {response.status_code}: {resp_text}"
+
+    # Try to parse JSON, fallback to raw text
+    try:
+        result = response.json()
+    except Exception:
+        result = None
+
+    if isinstance(result, dict) and result.get('success'):
+        return True, 'Email sent successfully'
+    if result and isinstance(result, dict):
+        return False, result.get('error', 'Apps Script returned error')
+    # Use raw text if JSON not returned
+    return False, resp_text[:1000]
+
+
+def unanswered_message(error):
+    """Message for a request the script did not answer in time, so was not retried"""
+    return f"No answer from the Apps Script (the email may have been sent): {error}"
+
+
+def encoded_size(pdf_path):
+    """Size of a file once base64 encoded into a payload"""
+    return (os.path.getsize(pdf_path) + 2) // 3 * 4
+
+
+def parse_batch_response(response, count):
+    """Interpret an Apps Script response to a batch of count emails as [(success, message), ...]"""
+    if response.status_code == 200:
+        try:
+            result = response.json()
+        except Exception:
+            result = None
+        results = result.get('results') if isinstance(result, dict) else None
+        if isinstance(results, list) and len(results) == count:
+            return [
+                (True, 'Email sent successfully') if isinstance(item, dict) and item.get('success')
+                else (False, (item.get('error') if isinstance(item, dict) else None)
+                      or 'Apps Script returned error')
+                for item in results
+            ]
+        if isinstance(result, dict) and not result.get('success') and result.get('error'):
+            return [(False, result['error'])] * count
+        # A script without batch support answers as for a single email
+        return [(False, "Apps Script did not return per-email results; "
+                        "update the script to accept batches")] * count
+    return [parse_response(response)] * count
+
+
+class EmailDispatcher:
+    """Send certificate emails concurrently through one pooled HTTP session.
+
+    submit() queues a send and returns a Future resolving to the recipient's
+    result record: a dict with 'email', 'name', 'pdf_path', 'success',
+    'message', 'attempts' and 'status_code'. At most max_in_flight requests
+    are open at once; RETRY_STATUSES responses and connection errors
+    (including connect timeouts) are retried up to max_retries times,
+    waiting backoff * 2**attempt seconds (or the server's Retry-After) in
+    between. A read timeout is not retried: the email may already be sent.
+
+    Each POST is timed as the 'email_post' stage of metrics (a
+    certificate_metrics.Metrics) if given, and retries are counted.
+
+    With batch_size > 1, submitted emails are grouped into batched POSTs of
+    up to batch_size emails and max_batch_bytes of attachments; a batch is
+    sent when it is full or on flush()/close(). A batch is retried as a
+    whole; each email still gets its own record from the per-email results.
+
+    Use as a context manager, or call close() to wait for pending sends.
+    """
+
+    def __init__(self, url, max_in_flight=4, max_retries=3, backoff=1.0, timeout=30,
+                 metrics=None, batch_size=1, max_batch_bytes=MAX_BATCH_BYTES):
+        self.url = url
+        self.metrics = metrics
+        self.batch_size = max(1, batch_size)
+        self.max_batch_bytes = max_batch_bytes
+        # Emails waiting for their batch to fill: [(args, Future, encoded size)]
+        self._batch = []
+        self._batch_bytes = 0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_in_flight))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight),
+                                            thread_name_prefix='email')
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit(self, email, subject, message, pdf_path, recipient_name=""):
+        args = (email, subject, message, pdf_path, recipient_name)
+        if self.batch_size <= 1:
+            return self._executor.submit(self.send, *args)
+
+        future = Future()
+        try:
+            size = encoded_size(pdf_path)
+        except OSError:
+            size = 0
+        with self._lock:
+            if self._batch and self._batch_bytes + size > self.max_batch_bytes:
+                self._flush_locked()
+            self._batch.append((args, future, size))
+            self._batch_bytes += size
+            if len(self._batch) >= self.batch_size:
+                self._flush_locked()
+        return future
+
+    def flush(self):
+        """Send the emails waiting for their batch to fill"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._batch:
+            self._executor.submit(self._send_batch_to_futures, self._batch)
+            self._batch = []
+            self._batch_bytes = 0
+
+    def _send_batch_to_futures(self, batch):
+        try:
+            records = self.send_batch([args for args, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), record in zip(batch, records):
+            future.set_result(record)
+
+    @staticmethod
+    def _new_record(email, pdf_path, recipient_name):
+        return {
+            'email': email,
+            'name': recipient_name,
+            'pdf_path': pdf_path,
+            'success': False,
+            'message': '',
+            'attempts': 0,
+            'status_code': None,
+        }
+
+    def send_batch(self, emails):
+        """Send (email, subject, message, pdf_path, recipient_name) tuples in one POST.
+
+        Retries the batch as send() does and returns one record per email.
+        """
+        records = [self._new_record(args[0], args[3], args[4]) for args in emails]
+        try:
+            if not self.url:
+                for record in records:
+                    record['message'] = "Apps Script URL not configured"
+                return [self._finish(record) for record in records]
+            batch = [build_email_payload(*args) for args in emails]
+        except Exception as e:
+            for record in records:
+                record['message'] = str(e)
+            return [self._finish(record) for record in records]
+
+        status_code = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            if attempt and self.metrics:
+                self.metrics.inc('email_retries')
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json={'batch': batch},
+                                             timeout=self.timeout + 5 * len(batch))
+            except requests.ConnectionError as e:
+                results = [(False, str(e))] * len(batch)
+            except requests.Timeout as e:
+                results = [(False, unanswered_message(e))] * len(batch)
+                break
+            except Exception as e:
+                results = [(False, str(e))] * len(batch)
+                break
+            else:
+                if self.metrics:
+                    self.metrics.observe('email_post', time.perf_counter() - started)
+                    self.metrics.inc('email_batches')
+                status_code = response.status_code
+                log_response(response)
+                results = parse_batch_response(response, len(batch))
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, retry_after))
+
+        for record, (success, message) in zip(records, results):
+            record.update(success=success, message=message, attempts=attempt + 1,
+                          status_code=status_code)
+        return [self._finish(record) for record in records]
+
+    def send(self, email, subject, message, pdf_path, recipient_name=""):
+        """Send one email now (retrying as configured) and return its record"""
+        record = self._new_record(email, pdf_path, recipient_name)
+        try:
+            if not self.url:
+                record['message'] = "Apps Script URL not configured"
+                return self._finish(record)
+            email_data = build_email_payload(email, subject, message, pdf_path, recipient_name)
+        except Exception as e:
+            record['message'] = str(e)
+            return self._finish(record)
+
+        for attempt in range(self.max_retries + 1):
+            record['attempts'] = attempt + 1
+            retry_after = None
+            if attempt and self.metrics:
+                self.metrics.inc('email_retries')
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=email_data, timeout=self.timeout)
+            except requests.ConnectionError as e:
+                record['message'] = str(e)
+            except requests.Timeout as e:
+                record['message'] = unanswered_message(e)
+                break
+            except Exception as e:
+                record['message'] = str(e)
+                break
+            else:
+                if self.metrics:
+                    self.metrics.observe('email_post', time.perf_counter() - started)
+                record['status_code'] = response.status_code
+                log_response(response)
+                record['success'], record['message'] = parse_response(response)
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, retry_after))
+
+        return self._finish(record)
+
+    def _retry_delay(self, attempt, retry_after=None):
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return self.backoff * (2 ** attempt)
+
+    def _finish(self, record):
+        with self._lock:
+            if record['success']:
+                self.sent += 1
+            else:
+                self.failed += 1
+        return record
@@ -0,0 +1,1912 @@
+"""Headless certificate generation engine.
+
+Everything needed to turn a saved layout and a CSV/XLSX roster into PDF
+certificates lives here, with no tkinter import, so batches can run on
+machines without a display. ``app3.py`` drives the same engine from the GUI
+and ``certificate_cli.py`` drives it from the command line.
+"""
+import os
+import io
+import json
+import re
+import hashlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from multiprocessing import shared_memory
+import itertools
+import threading
+import time
+import zipfile
+import openpyxl
+import pandas as pd
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from PyPDF2 import PdfReader, PdfWriter
+
+from certificate_email import EmailDispatcher
+from certificate_quota import EmailQueue, EmailScheduler
+from certificate_journal import JobJournal, RenderManifest, layout_digest
+from certificate_metrics import METRICS_FILENAME, Metrics
+
+# Embed image streams as binary rather than ASCII85 text (which is 25% larger)
+rl_config.useA85 = 0
+
+VERIFY_URL = "https://avishkaar.co/s3_virtual/verify.php?uid={uid}"
+
+# Mode certificates are written in; the template is converted to it once per job
+OUTPUT_MODE = "RGB"
+
+# Rows per chunk when streaming a roster from disk
+DATA_CHUNK_ROWS = 5000
+
+# Number of (font path, size) pairs kept loaded; least recently used fonts are evicted
+FONT_CACHE_SIZE = 64
+
+# Minimum seconds between rewrites of the Prometheus metrics file during a run
+PROMETHEUS_INTERVAL = 5.0
+
+# Where certificates go: 'files' (one PDF per row), 'merged' (one PDF, a page per
+# row) or 'zip' (one PDF per row, streamed into a ZIP archive)
+OUTPUT_TARGETS = ('files', 'merged', 'zip')
+MERGED_FILENAME = "certificates.pdf"
+ZIP_FILENAME = "certificates.zip"
+# Pages of a merged PDF laid out in memory at a time (see iter_merged)
+MERGED_PART_PAGES = 500
+# "<number> 0 obj" and "<number> 0 R" in a PDF object (see concatenate_pdfs)
+PDF_REFERENCE = re.compile(rb"\b(\d+) 0 (obj|R)\b")
+
+# Raster output encoding (layout output settings, see page_geometry and save_pdf)
+FILE_FORMATS = ('pdf', 'png', 'jpeg', 'webp')
+IMAGE_ENCODINGS = ('jpeg', 'flate')
+PAGE_SIZES = {'A4': (595.28, 841.89), 'Letter': (612.0, 792.0)}  # points, portrait
+DEFAULT_JPEG_QUALITY = 75  # Pillow's default
+# Resolution assumed for a template whose file records none (see page_geometry):
+# certificate templates are normally drawn for print
+TEMPLATE_DPI = 300
+
+# Email rendition: a lighter copy of each certificate, written to this
+# subfolder of the output folder and attached instead of the archival file
+EMAIL_RENDITION_FOLDER = "email"
+EMAIL_JPEG_QUALITY = 50
+
+# Memory for rasterized text kept between rows (see TextSpriteCache)
+TEXT_SPRITE_CACHE_BYTES = 32 * 1024 * 1024
+# Charged per cache entry on top of its text and masks (key, bbox, list and dict)
+TEXT_SPRITE_ENTRY_BYTES = 400
+
+# Keys of a text field that are persisted in a layout file (the rest are Tk widgets)
+LAYOUT_FIELD_KEYS = ('id', 'type', 'csv_column', 'font_path', 'font_size',
+                     'font_color', 'position', 'sample_text', 'link_url')
+
+
+def clean_layout(layout):
+    """Copy of layout with only the persisted field keys (no Tk widgets), safe to pickle"""
+    data = dict(layout)
+    data['text_fields'] = [
+        {k: field.get(k) for k in LAYOUT_FIELD_KEYS} for field in layout.get('text_fields', [])
+    ]
+    data['verification'] = dict(layout.get('verification') or {})
+    data['email'] = dict(layout.get('email') or {})
+    data['output'] = dict(layout.get('output') or {})
+    return data
+
+
+def save_layout(layout, path):
+    """Write a layout dict (template, text fields, verification, email) to JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(clean_layout(layout), f, indent=2)
+
+
+def load_layout(path):
+    """Read a layout saved by save_layout, restoring positions as tuples"""
+    with open(path, 'r', encoding='utf-8') as f:
+        layout = json.load(f)
+
+    for field in layout.get('text_fields', []):
+        if field.get('position'):
+            field['position'] = tuple(field['position'])
+        field.setdefault('link_url', None)
+
+    verification = layout.setdefault('verification', {})
+    if verification.get('position'):
+        verification['position'] = tuple(verification['position'])
+    layout.setdefault('email', {})
+    layout.setdefault('output', {})
+    return layout
+
+
+def read_data_file(path, usecols=None):
+    """Load a CSV or Excel roster into a DataFrame of strings (empty cells stay NaN)"""
+    if path.endswith('.csv'):
+        return pd.read_csv(path, usecols=usecols, dtype=str)
+    return pd.read_excel(path, usecols=usecols, dtype=str)
+
+
+def file_signature(path):
+    """(size, mtime) of a data file, to tell whether an already parsed copy is current"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_data_columns(path):
+    """Column names of a CSV or Excel roster, reading only the header"""
+    if path.endswith('.csv'):
+        return list(pd.read_csv(path, nrows=0).columns)
+    return list(pd.read_excel(path, nrows=0).columns)
+
+
+def iter_data_file(path, usecols=None, chunksize=DATA_CHUNK_ROWS):
+    """Stream a roster as DataFrame chunks of strings, reading only usecols.
+
+    Row labels continue across chunks (0, 1, 2, ...) like a full read, so
+    output file numbering does not depend on the chunk size.
+    """
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunksize)
+        return
+
+    # pandas cannot chunk Excel files; stream rows with openpyxl instead
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        keep = [i for i, h in enumerate(header) if usecols is None or h in usecols]
+        columns = [header[i] for i in keep]
+
+        start = 0
+        chunk = []
+        for values in rows:
+            chunk.append([_excel_cell_text(values[i] if i < len(values) else None) for i in keep])
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+                start += len(chunk)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+    finally:
+        workbook.close()
+
+
+def _excel_cell_text(value):
+    """Excel cell value as read_excel(dtype=str) would give it (NaN when empty)"""
+    if value is None:
+        # Not None: a column that is empty throughout a chunk would keep it
+        return float('nan')
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+@lru_cache(maxsize=1)
+def default_font():
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path, font_size):
+    """Load a TrueType font, falling back to Pillow's default font.
+
+    Cached per (font_path, font_size), including fallbacks, so a missing font
+    file is probed once rather than on every row or preview redraw.
+    """
+    try:
+        if font_path:
+            return ImageFont.truetype(font_path, font_size)
+        return default_font()
+    except Exception:
+        return default_font()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def default_font_at(size):
+    """Pillow's default font at a given size (older Pillow only has one size)"""
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def scale_font(font, scale):
+    """The same face as a load_font result, at scale times its size"""
+    size = getattr(font, 'size', None)
+    if size is None:
+        return font  # bitmap font, fixed size
+    scaled_size = max(1, round(size * scale))
+    font_path = getattr(font, 'path', None)
+    if isinstance(font_path, str):
+        return load_font(font_path, scaled_size)
+    return default_font_at(scaled_size)
+
+
+def load_verification_font(font_size):
+    """Prefer Arial for the verification ID, otherwise fall back to the default font"""
+    return load_font("arial.ttf", font_size)
+
+
+class PreviewPyramid:
+    """Downscaled copies of a template for the preview canvas.
+
+    Successive halvings of the template are built once; a display size is
+    resized from the smallest level still at least that large, and the last
+    few display sizes are kept, so redraws and zoom steps do not touch the
+    full-resolution template.
+    """
+
+    def __init__(self, template_image, min_side=256, max_cached=8):
+        image = template_image
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        self.levels = [image]
+        while min(image.size) // 2 >= min_side:
+            image = image.reduce(2)
+            self.levels.append(image)
+        self.max_cached = max_cached
+        self._cache = {}
+
+    def get(self, size):
+        """Template resized to size (width, height); do not draw on the result"""
+        image = self._cache.pop(size, None)
+        if image is None:
+            source = self.levels[0]
+            for level in self.levels:
+                if level.size[0] >= size[0] and level.size[1] >= size[1]:
+                    source = level
+            image = source.resize(size, Image.Resampling.LANCZOS)
+            if len(self._cache) >= self.max_cached:
+                # Drop the least recently used size
+                self._cache.pop(next(iter(self._cache)))
+        self._cache[size] = image
+        return image
+
+
+def text_size(draw, text, font):
+    """Return (width, height) of text as drawn with font"""
+    try:
+        bbox = draw.textbbox((0, 0), text, font=font)
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except AttributeError:
+        return draw.textsize(text, font=font)
+
+
+class TextSpriteCache:
+    """LRU of measured and rasterized text, shared by every row of a job.
+
+    Fields that repeat across rows (course, date, department...) are measured
+    and rasterized once. Sprites are 8-bit coverage masks, so one entry serves
+    every color; draw() pastes the ink through the mask, which is the same
+    blend draw.text does. Entries are evicted least recently used first once
+    their masks, plus TEXT_SPRITE_ENTRY_BYTES and the text per entry, exceed
+    max_bytes, so entries that are only measured (vector pages) count too.
+    """
+
+    def __init__(self, mode=OUTPUT_MODE, max_bytes=TEXT_SPRITE_CACHE_BYTES):
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._measure = ImageDraw.Draw(Image.new(mode, (1, 1)))
+        # key -> [bbox at origin (0, 0), mask or None until first drawn,
+        #         {fill: RGBA ImageReader for PDF pages}]
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def _font_key(font):
+        path = getattr(font, 'path', None)
+        if isinstance(path, str):
+            return path, getattr(font, 'size', None)
+        return id(font)  # default font; load_font keeps it alive
+
+    def _entry(self, text, font):
+        key = (self._font_key(font), text)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [self._measure.textbbox((0, 0), text, font=font), None, {}]
+            self._entries[key] = entry
+            self._bytes += TEXT_SPRITE_ENTRY_BYTES + len(text)
+            self._evict()
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def bbox(self, text, font):
+        """draw.textbbox((0, 0), text, font=font)"""
+        return self._entry(text, font)[0]
+
+    def size(self, text, font):
+        """(width, height) as returned by text_size"""
+        left, top, right, bottom = self.bbox(text, font)
+        return right - left, bottom - top
+
+    def _mask(self, entry, text, font):
+        if entry[1] is None:
+            left, top, right, bottom = entry[0]
+            mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+            ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+            entry[1] = mask
+            self._bytes += mask.size[0] * mask.size[1]
+            self._evict()
+        return entry[1]
+
+    def draw(self, image, xy, text, fill, font):
+        """Draw text onto image like draw.text(xy, ...); returns the touched box"""
+        entry = self._entry(text, font)
+        mask = self._mask(entry, text, font)
+        x, y = int(xy[0]) + entry[0][0], int(xy[1]) + entry[0][1]
+        image.paste(ImageColor.getcolor(fill, image.mode), (x, y), mask)
+        return x, y, x + mask.size[0], y + mask.size[1]
+
+    def sprite(self, xy, text, fill, font):
+        """(box, ImageReader) of text as a transparent RGBA image, for drawing on PDF pages.
+
+        box is where draw(image, xy, ...) would put the text. Identical
+        sprites hash alike, so ReportLab embeds each one once per document.
+        """
+        entry = self._entry(text, font)
+        mask = self._mask(entry, text, font)
+        reader = entry[2].get(fill)
+        if reader is None:
+            rgba = Image.new("RGBA", mask.size, ImageColor.getcolor(fill, "RGB"))
+            rgba.putalpha(mask)
+            reader = entry[2][fill] = ImageReader(rgba)
+            self._bytes += 4 * mask.size[0] * mask.size[1]
+            self._evict()
+        x, y = int(xy[0]) + entry[0][0], int(xy[1]) + entry[0][1]
+        return (x, y, x + mask.size[0], y + mask.size[1]), reader
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            (_, text), (_, mask, readers) = self._entries.popitem(last=False)
+            self._bytes -= TEXT_SPRITE_ENTRY_BYTES + len(text)
+            if mask is not None:
+                self._bytes -= (1 + 4 * len(readers)) * mask.size[0] * mask.size[1]
+
+
+def sanitize_filename(text):
+    """Keep alphanumerics, spaces and underscores; spaces become underscores"""
+    sanitized = "".join(c for c in text if c.isalnum() or c in (" ", "_")).replace(" ", "_")
+    return sanitized[:50]  # Limit length
+
+
+def page_geometry(image_size, image_dpi=None, page_size='template', dpi=None):
+    """(page size in points, render scale, render DPI) for a template of image_size pixels.
+
+    page_size 'template' keeps one point per pixel, as before, unless dpi is
+    set, in which case the template's own DPI (image_dpi, or TEMPLATE_DPI if
+    its file records none) gives its physical size. 'A4' or 'Letter' sizes
+    the page so its long side matches the paper's; the short side follows
+    the template's aspect ratio. With dpi, the render scale downsamples the
+    template (never upsamples) so the page is rendered at that resolution.
+    The render DPI is the resolution of the (downsampled) template on paper,
+    which a template page without dpi still has, though it is drawn at one
+    point per pixel.
+    """
+    width, height = image_size
+    if page_size in PAGE_SIZES:
+        points_per_pixel = max(PAGE_SIZES[page_size]) / max(width, height)
+        template_dpi = 72.0 / points_per_pixel
+    else:
+        template_dpi = image_dpi or TEMPLATE_DPI
+        points_per_pixel = 72.0 / template_dpi if dpi else 1.0
+    scale = min(1.0, dpi / template_dpi) if dpi else 1.0
+    return (width * points_per_pixel, height * points_per_pixel), scale, template_dpi * scale
+
+
+def image_dpi(image):
+    """Horizontal DPI recorded in an image file, or None if there is none"""
+    try:
+        return float(image.info['dpi'][0]) or None
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+
+
+def link_rect(link_info, page_height, scale=1.0):
+    """Clickable PDF rectangle for a link dict ('position', 'font_size').
+
+    The position is the link's center in image coords (top-left origin); the
+    rectangle is returned in PDF coords (bottom-left origin). page_height is
+    in pixels; scale converts pixels to points, and the rectangle's minimum
+    size is in points so links stay as easy to click on a downsampled page.
+    """
+    x, y = link_info['position']
+    x, y, page_height = x * scale, y * scale, page_height * scale
+    # Determine clickable area based on font size (if provided)
+    fsize = int(link_info.get('font_size', 12) * scale)
+    rect_width = max(80, fsize * 6)
+    rect_height = max(12, int(fsize * 1.6))
+
+    x1 = x - rect_width // 2
+    x2 = x + rect_width // 2
+    # top of rect in image coords = y - rect_height//2
+    y_top = y - rect_height // 2
+    y_bottom = y + rect_height // 2
+    # convert to PDF coords
+    py1 = page_height - y_bottom
+    py2 = page_height - y_top
+    return (float(x1), float(py1), float(x2), float(py2))
+
+
+def write_certificate_pdf(certificate, links, output, page_size=None, encoding='jpeg',
+                          quality=DEFAULT_JPEG_QUALITY):
+    """Write an RGB certificate as a one-page PDF with URI link annotations in one pass.
+
+    With the default 'jpeg' encoding the image is JPEG encoded once (as
+    Pillow's own PDF writer does) and embedded as-is, so there is no
+    temporary PDF and nothing is re-parsed; 'flate' embeds it losslessly.
+    page_size is in points (default: one point per pixel).
+    output may be a path or a binary file object.
+    """
+    width, height = certificate.size
+    page_width, page_height = page_size or (width, height)
+    if encoding == 'flate':
+        image = ImageReader(certificate)
+    else:
+        image = JPEGImage(certificate, quality)
+
+    c = canvas.Canvas(output, pagesize=(page_width, page_height))
+    c.drawImage(image, 0, 0, width=page_width, height=page_height)
+    for link_info in links:
+        c.linkURL(link_info['url'], link_rect(link_info, height, page_width / width),
+                  relative=0, thickness=0)
+    c.showPage()
+    c.save()
+
+
+class JPEGImage(ImageReader):
+    """Image JPEG-encoded once and embedded verbatim as a PDF image XObject.
+
+    Canvas.drawImage names image XObjects by hashing getRGBData(); answering
+    with a digest of the JPEG bytes avoids decoding the JPEG again (for a
+    shared template, once per page it is drawn on).
+    """
+
+    def __init__(self, image, quality=DEFAULT_JPEG_QUALITY):
+        jpeg = io.BytesIO()
+        image.save(jpeg, format="JPEG", quality=quality)
+        self._digest = hashlib.md5(jpeg.getvalue()).hexdigest().encode('ascii')
+        jpeg.seek(0)
+        super().__init__(jpeg)
+
+    def getRGBData(self):
+        self._dataA = None
+        return self._digest
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def pdf_font_name(font_path):
+    """Register a TrueType file with ReportLab, which embeds only the glyphs used.
+
+    Returns the registered font name, or Helvetica if the file can't be used.
+    """
+    try:
+        name = "Cert" + hashlib.md5(font_path.encode('utf-8')).hexdigest()[:12]
+        pdfmetrics.registerFont(TTFont(name, font_path))
+        return name
+    except Exception:
+        return "Helvetica"
+
+
+def pdf_font(font):
+    """ReportLab (font name, size) matching a Pillow font from load_font"""
+    size = getattr(font, 'size', 10)
+    font_path = getattr(font, 'path', None)
+    if isinstance(font_path, str):
+        return pdf_font_name(font_path), size
+    return "Helvetica", size
+
+
+def draw_vector_page(c, template, texts, links, page_size, scale=1.0):
+    """Draw one certificate page: template XObject, then each text as PDF text.
+
+    texts are the ((x, y), text, fill, font) tuples from CertificateEngine.layout_row,
+    positioned exactly as Pillow would draw them (top-left origin, ascender anchor).
+    page_size is the rendered image size in pixels; scale converts pixels to points.
+    """
+    width, height = page_size
+    c.saveState()
+    c.scale(scale, scale)
+    c.drawImage(template, 0, 0, width=width, height=height)
+    for (x, y), text, fill, font in texts:
+        name, size = pdf_font(font)
+        ascent = font.getmetrics()[0] if hasattr(font, 'getmetrics') else size
+        c.setFont(name, size)
+        c.setFillColor(colors.toColor(fill))
+        c.drawString(x, height - (y + ascent), text)
+    c.restoreState()
+    for link_info in links:
+        c.linkURL(link_info['url'], link_rect(link_info, height, scale), relative=0, thickness=0)
+    c.showPage()
+
+
+def draw_raster_page(c, template, sprites, links, page_size, scale=1.0):
+    """Draw one certificate page: template XObject, then each text as an image sprite.
+
+    sprites are (box, ImageReader) pairs from TextSpriteCache.sprite, so the
+    text looks exactly as in raster mode while the template is shared by
+    every page of the document. page_size and scale are as for draw_vector_page.
+    """
+    width, height = page_size
+    c.saveState()
+    c.scale(scale, scale)
+    c.drawImage(template, 0, 0, width=width, height=height)
+    for (left, top, right, bottom), reader in sprites:
+        c.drawImage(reader, left, height - bottom, width=right - left, height=bottom - top,
+                    mask='auto')
+    c.restoreState()
+    for link_info in links:
+        c.linkURL(link_info['url'], link_rect(link_info, height, scale), relative=0, thickness=0)
+    c.showPage()
+
+
+def add_pdf_links(input_pdf, output_pdf, links_to_add, image_size, scale=1.0):
+    """Add clickable hyperlinks to PDF using ReportLab overlay.
+
+    Fallback for write_certificate_pdf: merges a link overlay into an
+    existing PDF and removes input_pdf. Either may also be a binary file
+    object (nothing is removed then).
+
+    links_to_add: list of dicts with 'position', 'text', 'url'
+    image_size: (width, height) of the certificate image
+    scale: PDF points per image pixel
+    """
+    try:
+        # Create overlay PDF with clickable rectangles
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=(image_size[0] * scale, image_size[1] * scale))
+
+        # Add invisible clickable rectangles for each link
+        for link_info in links_to_add:
+            c.linkURL(link_info['url'], link_rect(link_info, image_size[1], scale),
+                      relative=0, thickness=0)
+
+        c.showPage()
+        c.save()
+        packet.seek(0)
+
+        # Read the original PDF
+        reader = PdfReader(input_pdf)
+        writer = PdfWriter()
+
+        # Get first page and merge with overlay
+        if len(reader.pages) > 0:
+            first_page = reader.pages[0]
+            overlay_pdf = PdfReader(packet)
+            overlay_page = overlay_pdf.pages[0]
+            first_page.merge_page(overlay_page)
+
+        # Add all pages to writer
+        for page in reader.pages:
+            writer.add_page(page)
+
+        # Write output PDF
+        if isinstance(output_pdf, str):
+            with open(output_pdf, 'wb') as f:
+                writer.write(f)
+        else:
+            writer.write(output_pdf)
+
+        # Clean up temp file
+        if isinstance(input_pdf, str) and os.path.exists(input_pdf):
+            os.remove(input_pdf)
+
+    except Exception as e:
+        print(f"Error adding PDF links: {e}")
+        # Fallback: just copy input to output
+        if not isinstance(input_pdf, str):
+            output_pdf.write(input_pdf.getvalue())
+        elif os.path.exists(input_pdf):
+            os.rename(input_pdf, output_pdf)
+
+
+def concatenate_pdfs(input_paths, output_path):
+    """Write the pages of the PDFs at input_paths, in order, as one PDF at output_path.
+
+    PdfWriter parses every object and keeps every page until it writes, so
+    instead each input's objects are copied as bytes, renumbered, and the
+    input is released before the next is read: memory is bounded by the
+    largest input, not the whole document, and nothing is decoded. Objects
+    shared by pages of one input (the template image, fonts) stay shared;
+    each input brings its own copy. Inputs must be flat, classic-xref PDFs
+    as ReportLab's canvas writes them (see iter_merged).
+    """
+    offsets = [None]  # byte offset of each output object, by number - 1; 1 is the page tree
+    kids = []
+
+    with open(output_path, 'wb') as out:
+        out.write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+        for path in input_paths:
+            reader = PdfReader(path)
+            root = reader.trailer['/Root'].get_object()
+            pages_number = root.raw_get('/Pages').idnum
+            skip = {reader.trailer.raw_get('/Root').idnum, pages_number}
+            if '/Info' in reader.trailer:
+                skip.add(reader.trailer.raw_get('/Info').idnum)
+            starts = sorted((offset, number) for number, offset in reader.xref[0].items())
+            # Renumber the input's page tree as the output's, and the rest after what is written
+            numbers = {pages_number: 1}
+            for _, number in starts:
+                if number not in skip:
+                    offsets.append(None)
+                    numbers[number] = len(offsets)
+            kids.extend(numbers[kid.idnum] for kid in root['/Pages'].raw_get('/Kids'))
+
+            def renumber(match):
+                return b"%d 0 %s" % (numbers[int(match.group(1))], match.group(2))
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            ends = [offset for offset, _ in starts[1:]] + [len(data)]
+            for (start, number), end in zip(starts, ends):
+                if number in skip:
+                    continue
+                body = data[start:data.rindex(b"endobj", start, end) + len(b"endobj")]
+                # References only occur in the dictionary, never in stream data
+                head, stream, tail = body.partition(b"\nstream\n")
+                offsets[numbers[number] - 1] = out.tell()
+                out.write(PDF_REFERENCE.sub(renumber, head) + stream + tail + b"\n")
+            del reader, data
+
+        offsets[0] = out.tell()
+        out.write(b"1 0 obj\n<< /Type /Pages /Count %d /Kids [ %s ] >>\nendobj\n"
+                  % (len(kids), b" ".join(b"%d 0 R" % kid for kid in kids)))
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n<< /Type /Catalog /Pages 1 0 R >>\nendobj\n" % len(offsets))
+
+        xref_offset = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for offset in offsets:
+            out.write(b"%010d 00000 n \n" % offset)
+        out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                  % (len(offsets) + 1, len(offsets), xref_offset))
+
+
+# A layout compiled against a roster's columns (see CertificateEngine.render_plan).
+# column is a position in row.values, or None when the roster lacks the column.
+FieldOp = namedtuple('FieldOp', 'column position fill font is_name')
+LinkOp = namedtuple('LinkOp', 'column position url font font_size')
+VerificationOp = namedtuple('VerificationOp', 'column position font font_size')
+RenderPlan = namedtuple('RenderPlan', 'columns fields name_columns links verification email_column')
+
+# Per-row values computed a chunk at a time by CertificateEngine.prepare_chunk.
+# texts holds the display text of each plan field; uid is None when the row has none.
+PreparedRow = namedtuple('PreparedRow',
+                         'pdf_filename sanitized_name recipient_name email email_valid uid texts')
+
+
+def cell_text(value):
+    """Display text of a roster cell ("N/A" when empty)"""
+    text = str(value).strip()
+    if not text or pd.isna(value):
+        return "N/A"
+    return text
+
+
+def compile_plan(layout, columns, scale=1.0):
+    """Resolve layout's fields, links and verification against columns into a RenderPlan.
+
+    Positions and font sizes are multiplied by scale, the render scale of a
+    downsampled template (see page_geometry).
+    """
+    columns = list(columns)
+    positions = {col: i for i, col in reversed(list(enumerate(columns)))}
+
+    def at(position):
+        return tuple(round(v * scale) for v in position)
+
+    def sized(size):
+        return max(1, round(size * scale))
+
+    fields = tuple(
+        FieldOp(positions.get(field['csv_column']), at(field['position']), field['font_color'],
+                load_font(field['font_path'], sized(field['font_size'])),
+                field['type'].lower() == 'name')
+        for field in layout['text_fields']
+    )
+    name_columns = tuple(op.column for op in fields if op.is_name)
+
+    links = tuple(
+        LinkOp(positions.get(field['csv_column']), at(field['position']), field['link_url'],
+               load_font(field.get('font_path'), sized(max(12, int(field.get('font_size', 12) * 0.6)))),
+               sized(int(field.get('font_size', 12))))
+        for field in layout['text_fields']
+        if field.get('link_url') and field.get('position')
+    )
+
+    verification = None
+    settings = layout['verification']
+    uid_column = positions.get(settings.get('uid_column'))
+    if settings.get('enabled') and settings.get('position') and uid_column is not None:
+        font_size = int(settings.get('font_size', 14))
+        verification = VerificationOp(uid_column, at(settings['position']),
+                                      load_verification_font(sized(max(8, font_size))), sized(font_size))
+
+    email_column = None
+    if layout['email'].get('enabled'):
+        email_column = positions.get(layout['email'].get('email_column', ''))
+
+    return RenderPlan(columns, fields, name_columns, links, verification, email_column)
+
+
+def display_text_column(series):
+    """cell_text for a whole column"""
+    text = series.map(str).str.strip()
+    return text.where(series.notna() & (text != ''), "N/A")
+
+
+def sanitize_filename_column(series):
+    """sanitize_filename for a whole column of strings"""
+    # \w is exactly str.isalnum() plus the underscore
+    return series.str.replace(r'[^\w ]', '', regex=True).str.replace(' ', '_', regex=False).str[:50]
+
+
+class JobControl:
+    """Pause/resume/cancel switch shared between a UI thread and CertificateEngine.run"""
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self.cancelled = False
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()
+
+    def checkpoint(self):
+        """Block while paused; returns False once the job has been cancelled"""
+        self._running.wait()
+        return not self.cancelled
+
+
+class CertificateEngine:
+    """Render certificates for a layout and a roster DataFrame, without any UI.
+
+    layout is the dict produced by CertificateGenerator.get_layout() / load_layout():
+    'template_path', 'text_fields', 'verification', 'email' and 'output'
+    settings. output['mode'] is 'raster' (text burned into the image) or
+    'vector' (template image plus real PDF text).
+    """
+
+    def __init__(self, layout, template_image=None, geometry=None):
+        self.layout = clean_layout(layout)
+        self.text_fields = self.layout['text_fields']
+        self.verification = self.layout['verification']
+        self.email = self.layout['email']
+        output = self.layout['output']
+        self.output_mode = output.get('mode', 'raster')
+        self.output_target = output.get('target', 'files')
+        self.file_format = output.get('file_format', 'pdf')
+        self.image_encoding = output.get('image_encoding', 'jpeg')
+        self.jpeg_quality = int(output.get('jpeg_quality') or DEFAULT_JPEG_QUALITY)
+        if template_image is None:
+            template_image = Image.open(layout['template_path'])
+        self.template_image = template_image
+
+        # Page size (points), render scale and DPI, worked out once per job. geometry
+        # is passed with a template that is already at render size (pool workers).
+        if geometry is None:
+            geometry = page_geometry(template_image.size, image_dpi(template_image),
+                                     output.get('page_size') or 'template', output.get('dpi'))
+            if geometry[1] < 1:
+                size = tuple(max(1, round(v * geometry[1])) for v in template_image.size)
+                template_image = template_image.resize(size, Image.Resampling.LANCZOS)
+        self.page_size, self.render_scale, self.render_dpi = geometry
+
+        # Pristine template in the output mode, converted once per job. Rows are
+        # drawn into a reused scratch copy; only the regions text was drawn into
+        # are restored from base_image before the next row.
+        if template_image.mode == OUTPUT_MODE:
+            self.base_image = template_image
+        else:
+            self.base_image = template_image.convert(OUTPUT_MODE)
+        self._scratch = None
+        self._dirty = []
+        # Text measurements and rasterized text, reused across rows
+        self._sprites = TextSpriteCache(OUTPUT_MODE)
+        # Template embedded once per job in vector mode (see JPEGImage)
+        self._template_xobject = None
+        # Computed on first use by content_hash
+        self._template_digest = None
+        self._layout_key = None
+        self._hash_columns = None
+        # Stage timings and counters; run() starts a fresh one per job
+        self.metrics = Metrics()
+        # Layout compiled against the roster's columns (see render_plan)
+        self._plan = None
+        self._plan_source = None
+
+        # Render scale of the email rendition relative to base_image, or None
+        # when emails attach the archival file (see save_email_rendition)
+        self.attachment_scale = None
+        attachment_dpi = self.email.get('attachment_dpi')
+        if self.email_enabled and (attachment_dpi or self.email.get('attachment_quality')):
+            self.attachment_scale = 1.0
+            if attachment_dpi:
+                self.attachment_scale = min(1.0, attachment_dpi / self.render_dpi)
+        self.attachment_quality = int(self.email.get('attachment_quality') or EMAIL_JPEG_QUALITY)
+        self._attachment_template = None
+
+    @property
+    def points_per_pixel(self):
+        """PDF points per pixel of base_image"""
+        return self.page_size[0] / self.base_image.size[0]
+
+    @property
+    def file_extension(self):
+        return ".jpg" if self.file_format == 'jpeg' else f".{self.file_format}"
+
+    @property
+    def verification_enabled(self):
+        return bool(self.verification.get('enabled') and self.verification.get('position'))
+
+    @property
+    def email_enabled(self):
+        return bool(self.email.get('enabled'))
+
+    def referenced_columns(self, columns):
+        """The columns of a roster this layout reads, in roster order.
+
+        Includes the first column, which names files when no Name field exists.
+        """
+        wanted = {field['csv_column'] for field in self.text_fields}
+        if self.email_enabled:
+            wanted.add(self.email.get('email_column', ''))
+        if self.verification_enabled:
+            wanted.add(self.verification.get('uid_column'))
+        columns = list(columns)
+        return [col for i, col in enumerate(columns) if i == 0 or col in wanted]
+
+    def missing_columns(self, columns):
+        """Return the referenced columns that are not present in columns"""
+        missing_columns = []
+        for field in self.text_fields:
+            if field['csv_column'] not in columns:
+                missing_columns.append(field['csv_column'])
+
+        # Check email column if email is enabled
+        if self.email_enabled:
+            email_column = self.email.get('email_column', '')
+            if email_column not in columns:
+                missing_columns.append(f"{email_column} (email)")
+        return missing_columns
+
+    def render_plan(self, columns):
+        """The layout compiled against columns, built once per roster layout"""
+        plan = self._plan
+        if plan is None or (columns is not self._plan_source and plan.columns != list(columns)):
+            plan = self._plan = compile_plan(self.layout, columns, self.render_scale)
+        self._plan_source = columns
+        return plan
+
+    def prepare_chunk(self, chunk):
+        """Compute every row's names, email and UID for a chunk, a column at a time.
+
+        Returns a list of PreparedRow in chunk order, giving the same values
+        the per-row methods (cell_text, row_names, get_uid) would.
+        """
+        plan = self.render_plan(chunk.columns)
+        if len(chunk) == 0:
+            return []
+        cells = chunk.iloc
+
+        texts = [display_text_column(cells[:, op.column]) for op in plan.fields]
+        names = [text for text, op in zip(texts, plan.fields) if op.is_name]
+        if names:
+            filename_base = names[0].str.cat(names[1:], sep="_") if len(names) > 1 else names[0]
+            recipient_names = names[-1]
+        else:
+            # Use first column value if no name field
+            filename_base = cells[:, 0].map(str)
+            recipient_names = itertools.repeat("")
+        sanitized_names = sanitize_filename_column(filename_base)
+        numbers = pd.Series(chunk.index + 1, index=chunk.index).astype(str)
+        pdf_filenames = sanitized_names + "_" + numbers + self.file_extension
+
+        if plan.email_column is not None:
+            column = cells[:, plan.email_column]
+            emails = column.map(str).str.strip().where(column.notna(), '')
+            email_valid = emails.str.contains('@', regex=False)
+        else:
+            emails = email_valid = itertools.repeat(None)
+
+        if plan.verification is not None:
+            column = cells[:, plan.verification.column]
+            uids = column.map(str).str.strip()
+            present = column.notna() & (uids != '')
+            uids = [uid if ok else None for uid, ok in zip(uids, present)]
+        else:
+            uids = itertools.repeat(None)
+
+        return [PreparedRow(*values[:6], values[6:])
+                for values in zip(pdf_filenames, sanitized_names, recipient_names,
+                                  emails, email_valid, uids, *texts)]
+
+    def preflight(self, data, report=None):
+        """Check a roster before rendering; returns a report dict for format_preflight.
+
+        data is a DataFrame or an iterable of chunks. Reports rows with an
+        invalid email address (when email is enabled), rows without a
+        verification UID (when verification is enabled) and, per field column,
+        how many rows are empty and will show "N/A". Findings are added to
+        report if given (see checked_chunks).
+        """
+        if isinstance(data, pd.DataFrame):
+            data = [data]
+        plan = None
+        if report is None:
+            report = preflight_report()
+        for chunk in data:
+            prepared = self.prepare_chunk(chunk)
+            plan = self.render_plan(chunk.columns)
+            for index, row in zip(chunk.index, prepared):
+                row_number = int(index) + 1
+                if plan.email_column is not None and not row.email_valid:
+                    report["invalid_emails"].append((row_number, row.recipient_name, row.email))
+                if plan.verification is not None and row.uid is None:
+                    report["missing_uids"].append((row_number, row.recipient_name))
+            for op, field in zip(plan.fields, self.text_fields):
+                empty = int(chunk.iloc[:, op.column].isna().sum()
+                            + (chunk.iloc[:, op.column].map(str).str.strip() == '').sum())
+                if empty:
+                    column = field['csv_column']
+                    report["empty_fields"][column] = report["empty_fields"].get(column, 0) + empty
+            report["rows"] += len(chunk)
+        if self.verification_enabled and (plan is None or plan.verification is None):
+            # UID column absent from the roster: no row gets a verification ID
+            report["missing_uids"] = [(None, "all rows")]
+        return report
+
+    def checked_chunks(self, chunks, report):
+        """Yield chunks unchanged, adding each one's pre-flight findings to report.
+
+        Checks a roster as it streams into run, instead of reading it twice.
+        """
+        for chunk in chunks:
+            self.preflight(chunk, report)
+            yield chunk
+
+    def get_uid(self, row, columns):
+        """Return the row's verification UID, or None if verification does not apply"""
+        op = self.render_plan(columns).verification
+        if op is None:
+            return None
+        value = row.values[op.column]
+        if pd.isna(value):
+            return None
+        return str(value).strip() or None
+
+    def _scratch_canvas(self):
+        """Return the reusable row canvas, with the previous row's text wiped"""
+        if self._scratch is None:
+            self._scratch = self.base_image.copy()
+        else:
+            for box in self._dirty:
+                self._scratch.paste(self.base_image.crop(box), box[:2])
+        self._dirty = []
+        return self._scratch
+
+    def _draw_text(self, xy, text, fill, font):
+        """Draw text from the sprite cache and record the touched region so it can be restored"""
+        left, top, right, bottom = self._sprites.draw(self._scratch, xy, text, fill, font)
+        width, height = self._scratch.size
+        # Pad for antialiasing and clamp to the image
+        box = (max(0, left - 2), max(0, top - 2),
+               min(width, right + 2), min(height, bottom + 2))
+        if box[0] < box[2] and box[1] < box[3]:
+            self._dirty.append(box)
+
+    def row_names(self, index, row):
+        """(pdf_filename, sanitized_name, recipient_name) of a row, without rendering it"""
+        values = row.values
+        name_parts = [cell_text(values[column])
+                      for column in self.render_plan(row.index).name_columns]
+        recipient_name = name_parts[-1] if name_parts else ""
+
+        # Create filename
+        if name_parts:
+            filename_base = "_".join(name_parts)
+        else:
+            # Use first column value if no name field
+            filename_base = str(values[0])
+        sanitized_name = sanitize_filename(filename_base)
+        return f"{sanitized_name}_{index+1}{self.file_extension}", sanitized_name, recipient_name
+
+    def template_digest(self):
+        """sha256 of the template file (or of its pixels when there is no file)"""
+        if self._template_digest is None:
+            digest = hashlib.sha256()
+            path = self.layout.get('template_path')
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+            else:
+                digest.update(self.base_image.tobytes())
+            self._template_digest = digest.hexdigest()
+        return self._template_digest
+
+    def job_key(self):
+        """Digest of the template file and layout; identifies a job for the journal"""
+        if self._layout_key is None:
+            self._layout_key = f"{self.template_digest()}:{layout_digest(self.layout)}"
+        return self._layout_key
+
+    def content_hash(self, row, columns):
+        """Digest of everything a row's certificate is rendered from.
+
+        Covers the template file, the layout (field positions, fonts, colors,
+        links, verification and output settings) and the row's values in the
+        columns the layout reads, except the email address.
+        """
+        if self._hash_columns is None:
+            email_column = self.email.get('email_column') if self.email_enabled else None
+            self._hash_columns = [c for c in self.referenced_columns(columns) if c != email_column]
+        text = '\x1f'.join([self.job_key()] + [str(row[c]) for c in self._hash_columns])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def layout_row(self, row, columns, prepared=None):
+        """Resolve one row into positioned text and links, without drawing.
+
+        prepared is the row's PreparedRow, if prepare_chunk computed one.
+        Returns (texts, links, name_parts, recipient_name). texts is a list of
+        ((x, y), text, fill, font) in draw order, with (x, y) the top-left
+        origin passed to draw.text; links is the list of link dicts expected
+        by write_certificate_pdf / add_pdf_links.
+        """
+        plan = self.render_plan(columns)
+        values = row.values
+        measure = self._sprites.size
+        texts = []
+
+        # Lay out all text fields
+        name_parts = []
+        recipient_name = ""
+
+        field_values = prepared.texts if prepared else [cell_text(values[op.column]) for op in plan.fields]
+        for op, field_value in zip(plan.fields, field_values):
+
+            # Store name for filename and email personalization
+            if op.is_name:
+                name_parts.append(field_value)
+                recipient_name = field_value
+
+            # Calculate text position (center at clicked position)
+            text_width, text_height = measure(field_value, op.font)
+            text_x = op.position[0] - text_width // 2
+            text_y = op.position[1] - text_height // 2
+
+            texts.append(((text_x, text_y), field_value, op.fill, op.font))
+
+        links = []
+
+        # If any fields have links, render them as visible text on certificate (blue)
+        for op in plan.links:
+            # Display text is the field value from CSV
+            link_display_text = str(values[op.column]) if op.column is not None else ''
+
+            if link_display_text:
+                tw, th = measure(link_display_text, op.font)
+                lx = op.position[0] - tw // 2
+                ly = op.position[1] + int(th * 0.8)
+                # Draw in blue to indicate it's a link
+                texts.append(((lx, ly), link_display_text, "#0000EE", op.font))
+
+                links.append({
+                    'position': op.position,
+                    'text': link_display_text,
+                    'url': op.url,
+                    'font_size': op.font_size
+                })
+
+        # Draw verification text and add clickable link to PDF
+        uid_val = prepared.uid if prepared else self.get_uid(row, columns)
+        if uid_val:
+            # Draw visible text in blue using configurable font size
+            op = plan.verification
+            vtext = f"Verification ID: {uid_val}"
+            tw, th = measure(vtext, op.font)
+            vx = op.position[0] - tw // 2
+            vy = op.position[1] - th // 2
+            texts.append(((vx, vy), vtext, "#0000EE", op.font))
+
+            links.append({
+                'position': op.position,
+                'text': vtext,
+                'url': VERIFY_URL.format(uid=uid_val),
+                'font_size': op.font_size
+            })
+
+        return texts, links, name_parts, recipient_name
+
+    def render(self, row, columns, prepared=None):
+        """Draw one row onto the engine's scratch copy of the template.
+
+        Returns (certificate, links, name_parts, recipient_name). The
+        certificate image is reused by the next render call, so save or copy
+        it before then.
+        """
+        with self.metrics.time('layout'):
+            texts, links, name_parts, recipient_name = self.layout_row(row, columns, prepared)
+        with self.metrics.time('draw'):
+            certificate = self._scratch_canvas()
+            for xy, text, fill, font in texts:
+                self._draw_text(xy, text, fill, font)
+        return certificate, links, name_parts, recipient_name
+
+    def save_pdf(self, certificate, links, pdf_path):
+        """Save a rendered certificate as PDF with its clickable links, in one pass.
+
+        pdf_path may also be a binary file object.
+        """
+        if certificate.mode != "RGB":
+            certificate = certificate.convert("RGB")
+
+        if not links and self.image_encoding == 'jpeg':
+            # Pillow's writer embeds a JPEG too; resolution sets the page size
+            with self.metrics.time('pdf_write'):
+                certificate.save(pdf_path, format="PDF", quality=self.jpeg_quality,
+                                 resolution=72.0 / self.points_per_pixel)
+            return
+
+        try:
+            with self.metrics.time('pdf_write'):
+                write_certificate_pdf(certificate, links, pdf_path, self.page_size,
+                                      self.image_encoding, self.jpeg_quality)
+        except Exception as e:
+            print(f"Warning: Single-pass PDF writer failed, using overlay merge: {e}")
+            self._save_pdf_with_overlay(certificate, links, pdf_path)
+
+    def _save_pdf_with_overlay(self, certificate, links, pdf_path):
+        """Two-step fallback: Pillow temp PDF, then merge a ReportLab link overlay"""
+        # Save certificate image as temporary PDF (in memory when writing to a file object)
+        if isinstance(pdf_path, str):
+            temp_pdf = pdf_path.replace(".pdf", "_temp.pdf")
+        else:
+            temp_pdf = io.BytesIO()
+        with self.metrics.time('pdf_write'):
+            certificate.save(temp_pdf, format="PDF", quality=self.jpeg_quality,
+                             resolution=72.0 / self.points_per_pixel)
+
+        # Now add clickable hyperlinks using ReportLab
+        try:
+            with self.metrics.time('pdf_link_merge'):
+                add_pdf_links(temp_pdf, pdf_path, links, certificate.size, self.points_per_pixel)
+        except Exception as e:
+            print(f"Warning: Failed to add hyperlinks: {e}")
+            # Fall back to temp file as final
+            if not isinstance(temp_pdf, str):
+                pdf_path.write(temp_pdf.getvalue())
+            elif os.path.exists(temp_pdf):
+                os.replace(temp_pdf, pdf_path)
+
+    def template_xobject(self):
+        """The template as an image for PDF pages, encoded once per job"""
+        if self._template_xobject is None:
+            if self.image_encoding == 'flate':
+                self._template_xobject = ImageReader(self.base_image)
+            else:
+                self._template_xobject = JPEGImage(self.base_image, self.jpeg_quality)
+        return self._template_xobject
+
+    def save_image(self, certificate, output):
+        """Save a rendered certificate as a PNG, JPEG or WebP image (links are not kept)"""
+        options = {'dpi': (72.0 / self.points_per_pixel,) * 2}
+        if self.file_format in ('jpeg', 'webp'):
+            options['quality'] = self.jpeg_quality
+        if certificate.mode != "RGB":
+            certificate = certificate.convert("RGB")
+        with self.metrics.time('image_write'):
+            certificate.save(output, format=self.file_format.upper(), **options)
+
+    def email_path(self, pdf_path):
+        """Path of the email rendition of the certificate at pdf_path"""
+        folder, filename = os.path.split(pdf_path)
+        return os.path.join(folder, EMAIL_RENDITION_FOLDER, filename)
+
+    def attachment_path(self, pdf_path):
+        """File to email for the certificate at pdf_path: its email rendition, if written"""
+        if self.attachment_scale:
+            email_path = self.email_path(pdf_path)
+            if os.path.exists(email_path):
+                return email_path
+        return pdf_path
+
+    def _attachment_size(self):
+        return tuple(max(1, round(v * self.attachment_scale)) for v in self.base_image.size)
+
+    def save_email_rendition(self, certificate, links, output):
+        """Save a rendered certificate again, downsampled and more compressed, for email.
+
+        Works from the image already drawn for the archival copy, so the row
+        is not drawn twice. Links keep their place on the page. Renditions are
+        written to EMAIL_RENDITION_FOLDER when the email settings ask for an
+        attachment_dpi or attachment_quality, and attached instead of the
+        archival file (see attachment_path).
+        """
+        scale = self.attachment_scale
+        with self.metrics.time('email_rendition'):
+            if scale < 1:
+                certificate = certificate.resize(self._attachment_size(), Image.Resampling.LANCZOS,
+                                                 reducing_gap=3.0)
+            if certificate.mode != "RGB":
+                certificate = certificate.convert("RGB")
+            if self.file_format != 'pdf':
+                options = {'dpi': (72.0 * certificate.size[0] / self.page_size[0],) * 2}
+                if self.file_format in ('jpeg', 'webp'):
+                    options['quality'] = self.attachment_quality
+                certificate.save(output, format=self.file_format.upper(), **options)
+                return
+            links = [
+                {**link_info, 'position': tuple(v * scale for v in link_info['position']),
+                 'font_size': link_info.get('font_size', 12) * scale}
+                for link_info in links
+            ]
+            write_certificate_pdf(certificate, links, output, self.page_size, 'jpeg',
+                                  self.attachment_quality)
+
+    def save_vector_email_rendition(self, texts, links, output):
+        """Vector counterpart of save_email_rendition: the same page over a lighter template"""
+        if self._attachment_template is None:
+            template = self.base_image
+            if self.attachment_scale < 1:
+                template = template.resize(self._attachment_size(), Image.Resampling.LANCZOS)
+            self._attachment_template = JPEGImage(template, self.attachment_quality)
+        with self.metrics.time('email_rendition'):
+            c = canvas.Canvas(output, pagesize=self.page_size)
+            draw_vector_page(c, self._attachment_template, texts, links, self.base_image.size,
+                             self.points_per_pixel)
+            c.save()
+
+    def save_vector_pdf(self, texts, links, pdf_path):
+        """Save a row as template image XObject plus real (searchable) PDF text"""
+        with self.metrics.time('pdf_write'):
+            c = canvas.Canvas(pdf_path, pagesize=self.page_size)
+            draw_vector_page(c, self.template_xobject(), texts, links, self.base_image.size,
+                             self.points_per_pixel)
+            c.save()
+
+    def add_merged_page(self, c, row, columns, prepared=None):
+        """Lay out one row as the next page of the merged document c"""
+        with self.metrics.time('layout'):
+            texts, links, _, _ = self.layout_row(row, columns, prepared)
+        with self.metrics.time('pdf_write'):
+            if self.output_mode == "vector":
+                draw_vector_page(c, self.template_xobject(), texts, links, self.base_image.size,
+                                 self.points_per_pixel)
+            else:
+                sprites = [self._sprites.sprite(xy, text, fill, font) for xy, text, fill, font in texts]
+                draw_raster_page(c, self.template_xobject(), sprites, links, self.base_image.size,
+                                 self.points_per_pixel)
+        self.metrics.inc('rows_rendered')
+
+    def _write_row(self, index, row, columns, output, prepared=None, email_output=None):
+        """Render one row and write its file to output (a path or binary file object).
+
+        With email_output, the email rendition is written there from the same render.
+        """
+        if self.output_mode == "vector" and self.file_format == 'pdf':
+            with self.metrics.time('layout'):
+                texts, links, _, _ = self.layout_row(row, columns, prepared)
+            self.save_vector_pdf(texts, links, output)
+            if email_output:
+                self.save_vector_email_rendition(texts, links, email_output)
+        else:
+            certificate, links, _, _ = self.render(row, columns, prepared)
+            if self.file_format != 'pdf':
+                self.save_image(certificate, output)
+            else:
+                self.save_pdf(certificate, links, output)
+            if email_output:
+                self.save_email_rendition(certificate, links, email_output)
+        self.metrics.inc('rows_rendered')
+
+    def _row_names(self, index, row, prepared):
+        if prepared:
+            return prepared[:3]
+        return self.row_names(index, row)
+
+    def generate_row(self, index, row, columns, output_folder, prepared=None):
+        """Render and save one row; returns (pdf_path, sanitized_name, recipient_name)"""
+        pdf_filename, sanitized_name, recipient_name = self._row_names(index, row, prepared)
+        pdf_path = os.path.join(output_folder, pdf_filename)
+        email_path = self.email_path(pdf_path) if self.attachment_scale else None
+        self._write_row(index, row, columns, pdf_path, prepared, email_path)
+        self.metrics.inc('bytes_written', os.path.getsize(pdf_path))
+        if email_path:
+            self.metrics.inc('email_bytes_written', os.path.getsize(email_path))
+        return pdf_path, sanitized_name, recipient_name
+
+    def generate_row_data(self, index, row, columns, prepared=None):
+        """Render one row in memory; returns (pdf_filename, pdf bytes, sanitized_name, recipient_name)"""
+        pdf_filename, sanitized_name, recipient_name = self._row_names(index, row, prepared)
+        output = io.BytesIO()
+        self._write_row(index, row, columns, output, prepared)
+        return pdf_filename, output.getvalue(), sanitized_name, recipient_name
+
+    def iter_generated(self, chunks, columns, output_folder, workers=1, reuse=None):
+        """Yield (index, row, prepared, generate_row result, reused) for every row of chunks, in order.
+
+        chunks is an iterable of DataFrames sharing columns; rows are rendered
+        as they are read, each chunk first going through prepare_chunk
+        (prepared is the row's PreparedRow). reuse(index, row, prepared) may
+        return (result, reason) for a row whose certificate is already on disk;
+        such rows are not rendered again and come back with reused=reason
+        (else None). With workers > 1 rows are rendered by a pool of processes,
+        each holding its own engine (fonts and scratch canvas) built once by
+        _init_worker. At most workers * 4 rows are in flight so memory stays bounded.
+        With output_folder None nothing is written and results come from
+        generate_row_data instead.
+        """
+        rows = self._iter_rows(chunks)
+        if workers <= 1:
+            for index, row, prepared in rows:
+                done = reuse(index, row, prepared) if reuse else None
+                if done:
+                    yield index, row, prepared, done[0], done[1]
+                elif output_folder is None:
+                    yield index, row, prepared, self.generate_row_data(index, row, columns, prepared), None
+                else:
+                    result = self.generate_row(index, row, columns, output_folder, prepared)
+                    yield index, row, prepared, result, None
+            return
+
+        # Workers map the pristine template from shared memory instead of
+        # receiving a pickled copy each
+        shm, image_spec = share_image(self.base_image)
+        try:
+            yield from self._iter_generated_in_pool(rows, columns, output_folder, workers,
+                                                    image_spec, reuse)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def iter_merged(self, chunks, columns, merged_path):
+        """Like iter_generated, but every row becomes a page of one PDF at merged_path.
+
+        The template is embedded once and shared by all pages (as are repeated
+        raster text sprites); only each page's own text and links are added.
+        ReportLab holds a document in memory until it is saved, so pages are
+        written in parts of MERGED_PART_PAGES, each saved next to merged_path
+        and joined into it (see concatenate_pdfs) when the iteration ends or
+        is closed; every part embeds its own copy of the template.
+        Pages are laid out in-process: there is no pixel work to spread out.
+        Every row is rendered again (there is no resume or incremental reuse)
+        and none is emailed, since email needs one file per recipient.
+        """
+        part_paths = []
+        c = None
+        try:
+            for index, row, prepared in self._iter_rows(chunks):
+                if c is None:
+                    part_paths.append(f"{merged_path}.part{len(part_paths) + 1}")
+                    c = canvas.Canvas(part_paths[-1], pagesize=self.page_size)
+                    pages = 0
+                self.add_merged_page(c, row, columns, prepared)
+                pages += 1
+                if pages == MERGED_PART_PAGES:
+                    with self.metrics.time('pdf_write'):
+                        c.save()
+                    c = None
+                pdf_filename, sanitized_name, recipient_name = prepared[:3]
+                yield index, row, prepared, (merged_path, sanitized_name, recipient_name), None
+        finally:
+            with self.metrics.time('pdf_write'):
+                if c is None and not part_paths:
+                    # No rows: still write an (empty) document
+                    canvas.Canvas(merged_path, pagesize=self.page_size).save()
+                elif c is not None:
+                    c.save()
+                if len(part_paths) == 1:
+                    os.replace(part_paths[0], merged_path)
+                elif part_paths:
+                    concatenate_pdfs(part_paths, merged_path)
+                    for part_path in part_paths:
+                        os.remove(part_path)
+            self.metrics.inc('bytes_written', os.path.getsize(merged_path))
+
+    def iter_zipped(self, chunks, columns, zip_path, workers=1):
+        """Like iter_generated, but each PDF is streamed from memory into a ZIP at zip_path.
+
+        Entries are stored, not deflated: the PDFs are already compressed.
+        Only the rows in flight are held in memory (see iter_generated); the
+        archive is finalized when the iteration ends or is closed. As with
+        iter_merged, rows are not reused from earlier runs or emailed.
+        """
+        archive = zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        try:
+            for index, row, prepared, result, _ in self.iter_generated(
+                    chunks, columns, None, workers):
+                pdf_filename, data, sanitized_name, recipient_name = result
+                with self.metrics.time('zip_write'):
+                    archive.writestr(pdf_filename, data)
+                self.metrics.inc('bytes_written', len(data))
+                yield index, row, prepared, (zip_path, sanitized_name, recipient_name), None
+        finally:
+            archive.close()
+
+    def _iter_rows(self, chunks):
+        """(index, row, PreparedRow) for every row of chunks"""
+        return itertools.chain.from_iterable(
+            ((index, row, prepared) for (index, row), prepared
+             in zip(chunk.iterrows(), self._timed_prepare(chunk)))
+            for chunk in self._timed_chunks(chunks)
+        )
+
+    def _timed_chunks(self, chunks):
+        """Iterate chunks, timing how long each takes to read"""
+        chunks = iter(chunks)
+        while True:
+            with self.metrics.time('load'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def _timed_prepare(self, chunk):
+        with self.metrics.time('prepare'):
+            return self.prepare_chunk(chunk)
+
+    def _iter_generated_in_pool(self, rows, columns, output_folder, workers, image_spec, reuse):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.layout, image_spec, columns,
+                                           (self.page_size, self.render_scale,
+                                            self.render_dpi))) as executor:
+            # (index, row, prepared, future or reused result, reuse reason), in row order
+            pending = deque()
+            for index, row, prepared in rows:
+                done = reuse(index, row, prepared) if reuse else None
+                if done:
+                    pending.append((index, row, prepared, done[0], done[1]))
+                else:
+                    future = executor.submit(_generate_row_in_worker, index, row, output_folder,
+                                             prepared)
+                    pending.append((index, row, prepared, future, None))
+                if len(pending) >= workers * 4:
+                    yield self._pending_result(pending.popleft())
+            while pending:
+                yield self._pending_result(pending.popleft())
+
+    def _pending_result(self, item):
+        index, row, prepared, result, reused = item
+        if not reused:
+            # Workers send their stage timings back with each row
+            result, metrics_state = result.result()
+            self.metrics.merge(metrics_state)
+        return index, row, prepared, result, reused
+
+    def _count_email(self, record):
+        """Count one recipient's result record in the metrics"""
+        if record.get('queued'):
+            self.metrics.inc('emails_queued')
+        elif record['success']:
+            self.metrics.inc('emails_sent' if record['attempts'] else 'emails_already_sent')
+        elif record['message'] == "Invalid email address":
+            self.metrics.inc('emails_invalid')
+        else:
+            self.metrics.inc('emails_failed')
+
+    def _record_email(self, email_results, record, counted=False):
+        """Tally one recipient's result record into email_results (and the metrics, unless counted)"""
+        if not counted:
+            self._count_email(record)
+        email_results["records"].append(record)
+        if record.get('queued'):
+            email_results["queued"] += 1
+        elif record['success']:
+            email_results["sent"] += 1
+        elif record['message'] == "Invalid email address":
+            email_results["errors"].append(f"{record['name']}: Invalid email address")
+            email_results["failed"] += 1
+        else:
+            email_results["failed"] += 1
+            email_results["errors"].append(f"{record['name']} ({record['email']}): {record['message']}")
+
+    def _email_dispatcher(self, metrics):
+        return EmailDispatcher(
+            self.email.get('apps_script_url', ''),
+            max_in_flight=int(self.email.get('max_in_flight', 4)),
+            max_retries=int(self.email.get('max_retries', 3)),
+            batch_size=int(self.email.get('batch_size') or 1),
+            metrics=metrics,
+        )
+
+    def _email_scheduler(self, dispatcher, queue, journal, metrics):
+        """EmailScheduler for the email settings' daily_quota and per_minute, or None.
+
+        Emails beyond the quota stay queued in the output folder and come back
+        with 'queued' records, unless wait_for_quota is set, in which case the
+        run keeps sending through the next quota windows (see _close_scheduler).
+        """
+        daily_quota = int(self.email.get('daily_quota') or 0)
+        per_minute = float(self.email.get('per_minute') or 0)
+        if not (daily_quota or per_minute):
+            return None
+        return EmailScheduler(dispatcher, queue, daily_quota, per_minute,
+                              on_result=journal.record_email_id, metrics=metrics)
+
+    def _close_scheduler(self, scheduler, progress, done, total, control, prometheus_path=None):
+        """Finish a scheduler's sends, waiting for quota windows if the settings say so.
+
+        The Prometheus file at prometheus_path keeps being updated meanwhile.
+        """
+        def on_wait(until):
+            if progress:
+                progress(done, total, "Email quota spent; waiting until "
+                                      f"{datetime.fromtimestamp(until):%Y-%m-%d %H:%M}")
+
+        written = [time.monotonic()]
+
+        def on_tick():
+            if prometheus_path and time.monotonic() - written[0] >= PROMETHEUS_INTERVAL:
+                self.metrics.write_prometheus(prometheus_path)
+                written[0] = time.monotonic()
+
+        scheduler.close(wait=bool(self.email.get('wait_for_quota')),
+                        cancelled=lambda: bool(control and control.cancelled), on_wait=on_wait,
+                        on_tick=on_tick)
+
+    def send_queued(self, output_folder, progress=None, control=None):
+        """Send the emails earlier runs left queued in output_folder for lack of quota.
+
+        Uses the layout's email settings; with wait_for_quota set, keeps going
+        through quota windows until the queue is empty. Returns email_results
+        as run does.
+        """
+        self.metrics = metrics = Metrics()
+        email_results = {"sent": 0, "failed": 0, "queued": 0, "errors": [], "records": []}
+        # Whatever layout queued them: a reset would forget what was rendered and sent
+        journal = JobJournal(output_folder, None)
+        queue = EmailQueue(output_folder)
+        finished = []
+
+        def on_result(email_id, record):
+            journal.record_email_id(email_id, record)
+            self._count_email(record)
+            finished.append(record)
+
+        dispatcher = self._email_dispatcher(metrics)
+        scheduler = EmailScheduler(dispatcher, queue, int(self.email.get('daily_quota') or 0),
+                                   float(self.email.get('per_minute') or 0), on_result=on_result,
+                                   metrics=metrics)
+        total = len(queue.pending)
+        try:
+            self._close_scheduler(scheduler, progress, 0, total, control)
+        finally:
+            dispatcher.close()
+            journal.close()
+        for record in finished:
+            self._record_email(email_results, record, counted=True)
+        for email, _, _, pdf_path, recipient_name in queue.pending.values():
+            self._record_email(email_results, {
+                'email': email, 'name': recipient_name, 'pdf_path': pdf_path,
+                'success': False, 'queued': True, 'message': "Still queued",
+                'attempts': 0, 'status_code': None,
+            })
+        queue.close()
+        return email_results
+
+    def run(self, data, output_folder, progress=None, email_sender=None, workers=1, total=None,
+            control=None, resume=True, incremental=False, prometheus_path=None):
+        """Generate a certificate for every row of data into output_folder.
+
+        data is a DataFrame or an iterable of DataFrame chunks (see
+        iter_data_file); chunks are rendered as they are read, by workers
+        rendering processes (1 renders in-process) for the layout's output
+        target (see iter_generated, iter_merged and iter_zipped).
+        progress(done, total, status_text) is called after each row; total is
+        len(data) for a DataFrame, else the total passed in (possibly None).
+        email_sender(email, subject, message, pdf_path, recipient_name) returns
+        (success, message) and is called inline; by default emails are posted
+        from this process as rendered rows come back (see _email_dispatcher
+        and _email_scheduler). control is an optional JobControl checked
+        between rows; a cancelled run stops early and returns what was done.
+        resume and incremental decide which rows already on disk are reused.
+        Stage timings go to self.metrics (see certificate_metrics), to
+        prometheus_path every PROMETHEUS_INTERVAL seconds and to
+        METRICS_FILENAME in output_folder at the end.
+        Returns {'generated_files': [...], 'email_results': {...}, 'cancelled': bool,
+        'unchanged': int, 'metrics': {...}}, where email_results['records'] holds
+        one result dict per recipient.
+        """
+        self.metrics = metrics = Metrics()
+        if isinstance(data, pd.DataFrame):
+            total = len(data)
+            data = [data]
+
+        # Validate columns on the first chunk before anything is written
+        chunks = iter(data)
+        with metrics.time('load'):
+            first = next(chunks, None)
+        if first is None:
+            first = pd.DataFrame()
+        missing_columns = self.missing_columns(first.columns)
+        if missing_columns:
+            raise ValueError(f"Missing CSV columns: {', '.join(missing_columns)}")
+        columns = first.columns
+        chunks = itertools.chain([first], chunks)
+
+        # Merged and zip targets write one file for the whole job
+        single_file = self.output_target in ('merged', 'zip')
+        if single_file and self.email_enabled:
+            raise ValueError("Emailing certificates needs one file per recipient; "
+                             "use the 'files' output target")
+        if self.output_target == 'merged' and self.file_format != 'pdf':
+            raise ValueError("The merged output target writes a PDF; "
+                             "use the 'files' or 'zip' target for image files")
+
+        # Create output folder (and the email rendition subfolder)
+        os.makedirs(output_folder, exist_ok=True)
+        if self.attachment_scale and not single_file:
+            os.makedirs(os.path.join(output_folder, EMAIL_RENDITION_FOLDER), exist_ok=True)
+        journal = JobJournal(output_folder, self.job_key(), resume=resume and not single_file)
+        manifest = RenderManifest(output_folder)
+
+        # Progress is journaled (see certificate_journal): with resume, a rerun
+        # of the same layout skips rows already rendered and emails already
+        # sent. With incremental, rows whose certificate on disk was rendered
+        # from the same content hash are skipped too, even across layout changes.
+        def reuse(index, row, prepared):
+            done = journal.completed_render(index, row, output_folder)
+            if done:
+                return done, 'resumed'
+            if incremental:
+                pdf_filename, sanitized_name, recipient_name = prepared[:3]
+                if manifest.unchanged(pdf_filename, self.content_hash(row, columns)):
+                    pdf_path = os.path.join(output_folder, pdf_filename)
+                    return (pdf_path, sanitized_name, recipient_name), 'unchanged'
+            return None
+
+        generated_files = []
+        unchanged = 0
+        email_results = {"sent": 0, "failed": 0, "queued": 0, "errors": [], "records": []}
+
+        # Get email settings if enabled. Without a custom sender, emails go out
+        # concurrently through an EmailDispatcher while rendering continues,
+        # paced by an EmailScheduler when a quota or rate is configured.
+        dispatcher = None
+        scheduler = None
+        email_queue = None
+        pending_emails = []
+        cancelled = False
+        if self.email_enabled:
+            email_subject = self.email.get('subject', '')
+            email_message = self.email.get('message', '')
+            if email_sender is None:
+                dispatcher = self._email_dispatcher(metrics)
+                if not single_file:
+                    email_queue = EmailQueue(output_folder, resume=resume)
+                    scheduler = self._email_scheduler(dispatcher, email_queue, journal, metrics)
+
+        if self.output_target == 'merged':
+            generated_rows = self.iter_merged(chunks, columns,
+                                              os.path.join(output_folder, MERGED_FILENAME))
+        elif self.output_target == 'zip':
+            generated_rows = self.iter_zipped(chunks, columns,
+                                              os.path.join(output_folder, ZIP_FILENAME), workers)
+        else:
+            generated_rows = self.iter_generated(chunks, columns, output_folder, workers, reuse)
+
+        prometheus_written = time.monotonic()
+        try:
+            # Generate certificates
+            for index, row, prepared, generated, reused in generated_rows:
+                pdf_path, sanitized_name, recipient_name = generated
+                generated_files.append(pdf_path)
+                if reused:
+                    metrics.inc(f'rows_{reused}')
+                if reused == 'unchanged':
+                    unchanged += 1
+                elif not reused and not single_file:
+                    journal.record_render(index, row, generated)
+                    manifest.record(os.path.basename(pdf_path), self.content_hash(row, columns))
+
+                # Send email if enabled (unchanged rows were handled by an earlier run)
+                if self.email_enabled and reused != 'unchanged':
+                    recipient_email = prepared.email
+                    if journal.email_sent(index, row):
+                        self._record_email(email_results, {
+                            'email': recipient_email, 'name': recipient_name,
+                            'pdf_path': pdf_path, 'success': True,
+                            'message': "Already sent by an earlier run",
+                            'attempts': 0, 'status_code': None,
+                        })
+                    elif prepared.email_valid:
+                        args = (recipient_email, email_subject, email_message,
+                                self.attachment_path(pdf_path), recipient_name)
+                        if scheduler:
+                            # The scheduler journals sends itself, including
+                            # those queued by earlier runs
+                            future = scheduler.submit(journal.email_id(index, row), *args)
+                        elif dispatcher:
+                            future = dispatcher.submit(*args)
+                            # Journal each send as soon as it completes
+                            future.add_done_callback(
+                                lambda f, index=index, row=row: journal.record_email(index, row, f.result())
+                            )
+                        else:
+                            future = None
+                            with metrics.time('email_post'):
+                                success, error_msg = email_sender(*args)
+                            record = {
+                                'email': recipient_email, 'name': recipient_name,
+                                'pdf_path': pdf_path, 'success': success, 'message': error_msg,
+                                'attempts': 1, 'status_code': None,
+                            }
+                            journal.record_email(index, row, record)
+                            self._record_email(email_results, record)
+                        if future:
+                            # Count each email as it completes, so the metrics
+                            # written during the run are up to date
+                            future.add_done_callback(lambda f: self._count_email(f.result()))
+                            pending_emails.append(future)
+                    else:
+                        self._record_email(email_results, {
+                            'email': recipient_email, 'name': recipient_name,
+                            'pdf_path': pdf_path, 'success': False,
+                            'message': "Invalid email address",
+                            'attempts': 0, 'status_code': None,
+                        })
+
+                # Report progress
+                if progress:
+                    status_text = f"{'Already done' if reused else 'Processing'}: {sanitized_name}"
+                    if self.email_enabled:
+                        sent = dispatcher.sent if dispatcher else email_results['sent']
+                        status_text += f" | Emails sent: {sent}"
+                    progress(len(generated_files), total, status_text)
+
+                if prometheus_path and time.monotonic() - prometheus_written >= PROMETHEUS_INTERVAL:
+                    metrics.write_prometheus(prometheus_path)
+                    prometheus_written = time.monotonic()
+
+                # Honour pause/cancel between rows
+                if control and not control.checkpoint():
+                    cancelled = True
+                    break
+        finally:
+            # Finishes the merged document or ZIP archive, or stops the rendering pool
+            generated_rows.close()
+            if scheduler:
+                self._close_scheduler(scheduler, progress, len(generated_files), total, control,
+                                      prometheus_path)
+            if dispatcher:
+                dispatcher.close()
+            if email_queue:
+                email_queue.close()
+            journal.close()
+            manifest.close()
+
+        for future in pending_emails:
+            self._record_email(email_results, future.result(), counted=True)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
+        summary = metrics.summary()
+        with open(os.path.join(output_folder, METRICS_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+        return {"generated_files": generated_files, "email_results": email_results,
+                "cancelled": cancelled, "unchanged": unchanged, "metrics": summary}
+
+
+def share_image(image):
+    """Copy image pixels into a new SharedMemory block.
+
+    Returns (shm, spec); pass spec to attach_image in another process. The
+    caller owns shm and must close() and unlink() it when done.
+    """
+    data = image.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    return shm, (shm.name, image.mode, image.size, len(data))
+
+
+def attach_image(spec):
+    """Open an image shared by share_image; returns (shm, image)"""
+    name, mode, size, length = spec
+    shm = shared_memory.SharedMemory(name=name)
+    image = Image.frombuffer(mode, size, shm.buf[:length], "raw", mode, 0, 1)
+    return shm, image
+
+
+# Per-process engine used by the rendering pool (see CertificateEngine.iter_generated)
+_worker_engine = None
+_worker_columns = None
+_worker_shm = None
+
+
+def _init_worker(layout, image_spec, columns, geometry):
+    global _worker_engine, _worker_columns, _worker_shm
+    _worker_shm, template_image = attach_image(image_spec)
+    _worker_engine = CertificateEngine(layout, template_image, geometry)
+    _worker_columns = columns
+
+
+def _generate_row_in_worker(index, row, output_folder, prepared=None):
+    """Returns (generate_row or, without output_folder, generate_row_data result, Metrics state of this row)"""
+    _worker_engine.metrics = Metrics()
+    if output_folder is None:
+        result = _worker_engine.generate_row_data(index, row, _worker_columns, prepared)
+    else:
+        result = _worker_engine.generate_row(index, row, _worker_columns, output_folder, prepared)
+    return result, _worker_engine.metrics.state()
+
+
+def resolve_workers(workers):
+    """Translate a worker setting into a process count; 0 means one per CPU core"""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def preflight_report():
+    """Empty report for CertificateEngine.preflight to add findings to"""
+    return {"rows": 0, "invalid_emails": [], "missing_uids": [], "empty_fields": {}}
+
+
+def format_preflight(report, limit=5):
+    """Human readable pre-flight report, or None when the roster has no problems"""
+    lines = []
+    if report["invalid_emails"]:
+        lines.append(f"Invalid email address in {len(report['invalid_emails'])} rows:")
+        lines += [f"  row {row}: {name} ({email})" for row, name, email in report["invalid_emails"][:limit]]
+        if len(report["invalid_emails"]) > limit:
+            lines.append(f"  ... and {len(report['invalid_emails']) - limit} more")
+    if report["missing_uids"]:
+        if report["missing_uids"][0][0] is None:
+            lines.append("Verification UID column missing: no certificate will have a verification ID")
+        else:
+            lines.append(f"No verification UID in {len(report['missing_uids'])} rows:")
+            lines += [f"  row {row}: {name}" for row, name in report["missing_uids"][:limit]]
+            if len(report["missing_uids"]) > limit:
+                lines.append(f"  ... and {len(report['missing_uids']) - limit} more")
+    for column, count in report["empty_fields"].items():
+        lines.append(f"Column '{column}' is empty in {count} rows (shown as N/A)")
+    if not lines:
+        return None
+    return f"Pre-flight check of {report['rows']} rows:\n" + "\n".join(lines)
+
+
+def summarize_results(result, output_folder, email_enabled=False):
+    """Human readable summary of a run, as shown at the end of generation"""
+    generated_files = result["generated_files"]
+    email_results = result["email_results"]
+    if result.get("cancelled"):
+        summary = f"Cancelled after generating {len(generated_files)} certificates in folder: {output_folder}"
+    else:
+        summary = f"Successfully generated {len(generated_files)} certificates in folder: {output_folder}"
+    if result.get("unchanged"):
+        summary += f"\n({result['unchanged']} unchanged certificates were kept as they were)"
+
+    if email_enabled:
+        summary += f"\n\nEmail Results:\n• Sent: {email_results['sent']}\n• Failed: {email_results['failed']}"
+        if email_results.get("queued"):
+            summary += (f"\n• Queued for the next quota window: {email_results['queued']} "
+                        "(sent by a rerun or --send-queued)")
+
+        if email_results["errors"]:
+            # Show first few errors
+            error_preview = "\n".join(email_results["errors"][:5])
+            if len(email_results["errors"]) > 5:
+                error_preview += f"\n... and {len(email_results['errors']) - 5} more errors"
+            summary += f"\n\nFirst few email errors:\n{error_preview}"
+    return summary
@@ -0,0 +1,200 @@
+"""On-disk job journal, so an interrupted run can be resumed.
+
+The journal is an append-only JSON-lines file in the output folder. The
+first line identifies the job (digests of the template and layout); every later line
+records one finished step for one row:
+
+    {"row": 17, "key": "...", "render": {"file": "...", "name": "...", "recipient": "..."}}
+    {"row": 17, "key": "...", "email": {"success": true, "message": "..."}}
+
+Each entry is written with a single append and flushed straight away, so
+a crash can at worst leave one torn last line, which is ignored on load.
+A rerun with the same layout skips rows whose certificate is journaled
+and still on disk, and only re-sends emails that did not succeed.
+
+RenderManifest, kept alongside, records the content hash every
+certificate was rendered from, for incremental regeneration.
+"""
+import os
+import json
+import hashlib
+import threading
+
+JOURNAL_FILENAME = '.certificate_job.jsonl'
+MANIFEST_FILENAME = '.certificate_manifest.jsonl'
+
+
+def layout_digest(layout):
+    """Digest of everything that affects how certificates look.
+
+    Email settings and the preview-only field keys (id, sample_text) are left out.
+    """
+    data = {k: v for k, v in layout.items() if k != 'email'}
+    data['text_fields'] = [
+        {k: v for k, v in field.items() if k not in ('id', 'sample_text')}
+        for field in layout.get('text_fields', [])
+    ]
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def row_key(row):
+    """Digest of a row's values, to notice a roster that changed between runs"""
+    text = '\x1f'.join(str(value) for value in row.values)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class JobJournal:
+    """Per-row render and send status for one output folder.
+
+    Opening a journal whose job digest differs from job_key (or that does
+    not exist, or with resume=False) starts a fresh one; otherwise earlier
+    entries are loaded. With job_key None the journal is opened whatever
+    job wrote it and is never reset, for appending sends that do not depend
+    on the layout (see CertificateEngine.send_queued). Safe to record from
+    several threads.
+    """
+
+    def __init__(self, output_folder, job_key, resume=True):
+        self.path = os.path.join(output_folder, JOURNAL_FILENAME)
+        self.job_key = job_key
+        self.rendered = {}
+        self.sent = set()
+        self._lock = threading.Lock()
+
+        if not (resume and self._load()):
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'job': job_key}) + '\n')
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Read an existing journal for this job; returns False if there is none"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return False
+        if self.job_key is None:
+            self.job_key = header.get('job')
+        elif header.get('job') != self.job_key:
+            return False
+
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn write from an interrupted run
+            key = (entry.get('row'), entry.get('key'))
+            if 'render' in entry:
+                self.rendered[key] = entry['render']
+            elif 'email' in entry:
+                if entry['email'].get('success'):
+                    self.sent.add(key)
+                else:
+                    self.sent.discard(key)
+        return True
+
+    def _append(self, entry):
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def completed_render(self, index, row, output_folder):
+        """(pdf_path, sanitized_name, recipient_name) if this row is already done, else None"""
+        done = self.rendered.get((int(index), row_key(row)))
+        if not done:
+            return None
+        pdf_path = os.path.join(output_folder, done['file'])
+        if not os.path.exists(pdf_path):
+            return None
+        return pdf_path, done['name'], done['recipient']
+
+    def record_render(self, index, row, generated):
+        pdf_path, sanitized_name, recipient_name = generated
+        render = {'file': os.path.basename(pdf_path), 'name': sanitized_name,
+                  'recipient': recipient_name}
+        index, key = int(index), row_key(row)
+        self.rendered[(index, key)] = render
+        self._append({'row': index, 'key': key, 'render': render})
+
+    def email_sent(self, index, row):
+        return (int(index), row_key(row)) in self.sent
+
+    @staticmethod
+    def email_id(index, row):
+        """'<row>:<row key>', naming a row's email outside the journal (see certificate_quota)"""
+        return f"{int(index)}:{row_key(row)}"
+
+    def record_email(self, index, row, record):
+        self._record_email(int(index), row_key(row), record)
+
+    def record_email_id(self, email_id, record):
+        index, key = email_id.split(':', 1)
+        self._record_email(int(index), key, record)
+
+    def _record_email(self, index, key, record):
+        if record['success']:
+            self.sent.add((index, key))
+        self._append({'row': index, 'key': key,
+                      'email': {'success': record['success'], 'message': record['message']}})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RenderManifest:
+    """Which content hash each certificate in an output folder was rendered from.
+
+    Unlike the job journal this survives layout changes: an incremental run
+    compares each row's content hash (layout, template and the row's values,
+    see CertificateEngine.content_hash) with the one recorded for its file
+    and only renders rows that differ. Stored as append-only JSON lines,
+    compacted to one line per file when opened.
+    """
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_FILENAME)
+        self.hashes = {}
+        self._lock = threading.Lock()
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.hashes[entry['file']] = entry['hash']
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn write from an interrupted run
+        except OSError:
+            pass
+
+        # Compact, then keep appending
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for file, content_hash in self.hashes.items():
+                f.write(json.dumps({'file': file, 'hash': content_hash}) + '\n')
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def unchanged(self, pdf_filename, content_hash):
+        """True if pdf_filename exists and was rendered from content_hash"""
+        return (self.hashes.get(pdf_filename) == content_hash
+                and os.path.exists(os.path.join(self.output_folder, pdf_filename)))
+
+    def record(self, pdf_filename, content_hash):
+        line = json.dumps({'file': pdf_filename, 'hash': content_hash}) + '\n'
+        with self._lock:
+            self.hashes[pdf_filename] = content_hash
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,145 @@
+"""Per-stage timings and counters for generation runs.
+
+A Metrics object collects latency histograms per stage (loading, layout,
+drawing, PDF writing, email POSTs...) and counters (rows rendered, bytes
+written, emails sent/failed, retries). summary() gives the JSON summary
+shown at the end of a job; write_prometheus() writes the same data in the
+Prometheus text format, for node_exporter's textfile collector.
+
+Histograms use fixed buckets, so the state of one Metrics can be merged
+into another: rendering processes send theirs back with each row.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets (plus +Inf)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# JSON summary written to the output folder at the end of a run
+METRICS_FILENAME = '.certificate_metrics.json'
+
+# Metric names in the Prometheus file start with this
+PROMETHEUS_PREFIX = 'certificate'
+
+
+class Metrics:
+    """Thread-safe stage timings and counters for one job"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        # stage -> {'buckets': [count per bucket, +Inf last], 'sum': s, 'count': n, 'max': s}
+        self.histograms = {}
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a with block as one observation of stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = {
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0, 'max': 0.0,
+                }
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(LATENCY_BUCKETS)
+            histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            histogram['max'] = max(histogram['max'], seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def state(self):
+        """Picklable copy of everything collected, for merge()"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {stage: {**h, 'buckets': list(h['buckets'])}
+                               for stage, h in self.histograms.items()},
+            }
+
+    def merge(self, state):
+        """Add another Metrics' state() into this one"""
+        with self._lock:
+            for name, amount in state['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for stage, other in state['histograms'].items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    self.histograms[stage] = {**other, 'buckets': list(other['buckets'])}
+                    continue
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+                histogram['sum'] += other['sum']
+                histogram['count'] += other['count']
+                histogram['max'] = max(histogram['max'], other['max'])
+
+    def summary(self):
+        """JSON-friendly summary: counters plus count, total and percentiles per stage"""
+        state = self.state()
+        stages = {}
+        for stage, histogram in sorted(state['histograms'].items()):
+            count = histogram['count']
+            stages[stage] = {
+                'count': count,
+                'total_seconds': round(histogram['sum'], 4),
+                'mean_ms': round(histogram['sum'] / count * 1000, 3) if count else None,
+                'p50_ms': _quantile_ms(histogram, 0.50),
+                'p90_ms': _quantile_ms(histogram, 0.90),
+                'p99_ms': _quantile_ms(histogram, 0.99),
+                'max_ms': round(histogram['max'] * 1000, 3),
+            }
+        return {'counters': dict(sorted(state['counters'].items())), 'stages': stages}
+
+    def write_prometheus(self, path):
+        """Write all metrics in the Prometheus text format, replacing path atomically"""
+        state = self.state()
+        name = f'{PROMETHEUS_PREFIX}_stage_seconds'
+        lines = [f'# HELP {name} Time spent per pipeline stage.', f'# TYPE {name} histogram']
+        for stage, histogram in sorted(state['histograms'].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram["count"]}')
+        for counter, value in sorted(state['counters'].items()):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter')
+            lines.append(f'{PROMETHEUS_PREFIX}_{counter}_total {value}')
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, path)
+
+
+def _quantile_ms(histogram, q):
+    """Estimate a quantile by interpolating inside its bucket, as Prometheus does"""
+    count = histogram['count']
+    if not count:
+        return None
+    rank = q * count
+    cumulative = 0
+    lower = 0.0
+    for bound, bucket_count in zip(LATENCY_BUCKETS, histogram['buckets']):
+        if bucket_count and cumulative + bucket_count >= rank:
+            upper = min(bound, histogram['max'])
+            estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+            return round(estimate * 1000, 3)
+        cumulative += bucket_count
+        lower = bound
+    return round(histogram['max'] * 1000, 3)
@@ -0,0 +1,97 @@
+"""Profiling mode for generation runs.
+
+profiled() wraps a run in cProfile and tracemalloc and writes, next to the
+output folder:
+
+    <output>.profile.txt     cProfile stats sorted by cumulative and own time
+    <output>.pstats          raw stats, for snakeviz / pstats
+    <output>.memory.txt      peak traced memory and the top allocation sites
+
+cProfile only sees the thread that enabled it, so profiling the GUI's job
+thread leaves out the Tk event loop. Rendering processes are not profiled;
+profile runs should render in-process (workers=1).
+"""
+import io
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+# Rows of the stats tables and allocation sites written to the reports
+PROFILE_TOP = 40
+
+# Stack frames kept per allocation by tracemalloc
+TRACEMALLOC_FRAMES = 10
+
+
+def profile_paths(output_folder):
+    """(stats text, raw stats, memory report) paths for an output folder"""
+    base = output_folder.rstrip('/\\')
+    return f"{base}.profile.txt", f"{base}.pstats", f"{base}.memory.txt"
+
+
+@contextmanager
+def profiled(output_folder, top=PROFILE_TOP):
+    """Profile the body of a with block; the reports are written when it exits"""
+    stats_path, raw_path, memory_path = profile_paths(output_folder)
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+
+        profiler.dump_stats(raw_path)
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text).strip_dirs()
+        text.write("=== By cumulative time ===\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        text.write("\n=== By own time ===\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        with open(memory_path, 'w', encoding='utf-8') as f:
+            f.write(f"Peak traced memory: {peak / 2**20:.1f} MiB "
+                    f"(still allocated at the end: {current / 2**20:.1f} MiB)\n")
+            f.write(f"\n=== Top {top} allocation sites still alive at the end ===\n")
+            for stat in snapshot.statistics('lineno')[:top]:
+                f.write(f"{stat}\n")
+            f.write(f"\n=== Top {min(top, 10)} allocation stacks ===\n")
+            for stat in snapshot.statistics('traceback')[:min(top, 10)]:
+                f.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+
+def limit_rows(chunks, rows):
+    """The first rows rows of an iterable of DataFrame chunks"""
+    for chunk in chunks:
+        if rows <= 0:
+            return
+        if len(chunk) > rows:
+            chunk = chunk.iloc[:rows]
+        rows -= len(chunk)
+        yield chunk
+
+
+def first_rows(data, rows):
+    """limit_rows for a DataFrame or an iterable of chunks; None leaves data as it is"""
+    if rows is None:
+        return data
+    if hasattr(data, 'iloc'):
+        return data.iloc[:rows]
+    return limit_rows(data, rows)
+
@@ -0,0 +1,299 @@
+"""Quota-aware pacing of certificate emails.
+
+Apps Script accounts may only email so many recipients a day (about 100 on
+consumer Gmail, 1500 on Workspace). EmailScheduler sits in front of an
+EmailDispatcher: it feeds emails to it at a steady rate, counts recipients
+against the daily quota over a rolling 24 hour window, and once the quota
+is spent (by its own count, or because the script says so) keeps the rest
+queued on disk instead of sending them only to be rejected. The queue is
+sent once the window frees up: by the same run if it waits for it, by a
+rerun of the job, or by CertificateEngine.send_queued.
+
+EmailQueue is an append-only JSON-lines file in the output folder:
+
+    {"send": 1760000000.0}                      one recipient counted against the quota
+    {"exhausted": 1760000000.0}                 the script reported the quota spent
+    {"queue": "17:<row key>", "email": [...]}   an email waiting to be sent
+    {"done": "17:<row key>"}                    sent, or failed for good
+
+compacted when opened, like the render manifest.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+
+QUEUE_FILENAME = '.email_queue.jsonl'
+
+# Apps Script quotas are counted over a rolling day
+QUOTA_WINDOW = 24 * 60 * 60
+
+# Lowercased fragments of the Apps Script errors meaning the email quota is spent
+QUOTA_ERRORS = ('too many times for one day', 'limit exceeded: email', 'email quota')
+
+
+def is_quota_error(message):
+    """True if an Apps Script error message says the daily email quota is spent"""
+    message = (message or '').lower()
+    return any(marker in message for marker in QUOTA_ERRORS)
+
+
+class EmailQueue:
+    """Quota ledger and unsent emails for one output folder.
+
+    With resume=False emails queued by an earlier run are dropped; the quota
+    ledger is always kept, since the quota belongs to the account.
+    """
+
+    def __init__(self, output_folder, resume=True):
+        self.path = os.path.join(output_folder, QUEUE_FILENAME)
+        self.sends = []
+        self.exhausted = None
+        # email id -> (email, subject, message, attachment path, recipient name)
+        self.pending = OrderedDict()
+        self._lock = threading.Lock()
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._load_entry(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn write from an interrupted run
+        except OSError:
+            pass
+        if not resume:
+            self.pending.clear()
+
+        # Compact (forgetting sends that left the window), then keep appending
+        now = time.time()
+        self.sends = [t for t in self.sends if t > now - QUOTA_WINDOW]
+        if self.exhausted is not None and self.exhausted <= now - QUOTA_WINDOW:
+            self.exhausted = None
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for sent_at in self.sends:
+                f.write(json.dumps({'send': sent_at}) + '\n')
+            if self.exhausted is not None:
+                f.write(json.dumps({'exhausted': self.exhausted}) + '\n')
+            for email_id, email in self.pending.items():
+                f.write(json.dumps({'queue': email_id, 'email': email}) + '\n')
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load_entry(self, entry):
+        if 'send' in entry:
+            self.sends.append(float(entry['send']))
+        elif 'exhausted' in entry:
+            self.exhausted = float(entry['exhausted'])
+        elif 'queue' in entry:
+            self.pending[entry['queue']] = tuple(entry['email'])
+        elif 'done' in entry:
+            self.pending.pop(entry['done'], None)
+
+    def _append(self, entry):
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def add(self, email_id, email):
+        """Queue email (a tuple of send arguments) unless email_id is already queued"""
+        if email_id not in self.pending:
+            self.pending[email_id] = tuple(email)
+            self._append({'queue': email_id, 'email': list(email)})
+
+    def done(self, email_id):
+        if self.pending.pop(email_id, None) is not None:
+            self._append({'done': email_id})
+
+    def record_send(self, sent_at):
+        self.sends.append(sent_at)
+        self._append({'send': sent_at})
+
+    def record_exhausted(self, at):
+        self.exhausted = at
+        self._append({'exhausted': at})
+
+    def opens_at(self, now, daily_quota):
+        """Earliest time the quota has room for one more recipient (now if it has)"""
+        self.sends = [t for t in self.sends if t > now - QUOTA_WINDOW]
+        if self.exhausted is not None and self.exhausted > now - QUOTA_WINDOW:
+            # The script knows better than our count (the account may send
+            # other mail too): wait for the oldest send we know of to expire
+            return (self.sends[0] if self.sends else self.exhausted) + QUOTA_WINDOW
+        if daily_quota and len(self.sends) >= daily_quota:
+            return self.sends[len(self.sends) - daily_quota] + QUOTA_WINDOW
+        return now
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class EmailScheduler:
+    """Feed emails to an EmailDispatcher within a daily quota and a rate.
+
+    submit() returns a Future resolving to the recipient's result record, as
+    EmailDispatcher.submit does. Every email is written to the EmailQueue
+    first and removed once sent (or failed for good), so emails still queued
+    from an earlier run go out too, first. A send the script rejects for
+    quota is not retried: it goes back to the queue until the window frees up.
+
+    on_result(email_id, record) is called from the sending threads for every
+    email that was sent or failed for good, whether submitted by this run or
+    queued by an earlier one.
+    """
+
+    def __init__(self, dispatcher, queue, daily_quota=None, per_minute=None, on_result=None,
+                 metrics=None):
+        self.dispatcher = dispatcher
+        self.queue = queue
+        self.daily_quota = daily_quota
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.on_result = on_result
+        self.metrics = metrics
+        # While the quota is spent: when it frees up (else None)
+        self.waiting_until = None
+
+        self._cond = threading.Condition()
+        self._ready = deque(queue.pending)
+        self._futures = {}
+        self._finished = {}
+        self._closing = False
+        self._closed = False
+        self._wait_for_window = False
+        self._next_send = 0.0
+        self._thread = threading.Thread(target=self._feed, name='email-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, email_id, email, subject, message, pdf_path, recipient_name=""):
+        with self._cond:
+            if email_id in self._finished:
+                future = Future()
+                future.set_result(self._finished[email_id])
+                return future
+            future = self._futures.get(email_id)
+            if future is None:
+                future = self._futures[email_id] = Future()
+            if email_id not in self.queue.pending:
+                self.queue.add(email_id, (email, subject, message, os.path.abspath(pdf_path),
+                                          recipient_name))
+                self._ready.append(email_id)
+                self._cond.notify()
+        return future
+
+    def _feed(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._closing:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+
+                now = time.time()
+                opens_at = self.queue.opens_at(now, self.daily_quota)
+                if opens_at > now:
+                    if self._closing and not self._wait_for_window:
+                        return
+                    self.waiting_until = opens_at
+                    # A partly filled batch should not wait for the window too
+                    self.dispatcher.flush()
+                    self._cond.wait(opens_at - now)
+                    continue
+                self.waiting_until = None
+                if self._next_send > now:
+                    self._cond.wait(self._next_send - now)
+                    continue
+
+                email_id = self._ready.popleft()
+                email = self.queue.pending.get(email_id)
+                if email is None:
+                    continue
+                self.queue.record_send(now)
+                self._next_send = now + self.interval
+
+            future = self.dispatcher.submit(*email)
+            future.add_done_callback(lambda f, email_id=email_id: self._sent(email_id, f))
+
+    def _sent(self, email_id, future):
+        email, _, _, pdf_path, recipient_name = self.queue.pending[email_id]
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {'email': email, 'name': recipient_name, 'pdf_path': pdf_path,
+                      'success': False, 'message': str(e), 'attempts': 1, 'status_code': None}
+        if not record['success'] and is_quota_error(record['message']):
+            if self.metrics:
+                self.metrics.inc('emails_quota_rejected')
+            with self._cond:
+                self.queue.record_exhausted(time.time())
+                if not self._closed:
+                    self._ready.appendleft(email_id)
+                    self._cond.notify()
+                    return
+                outer = self._futures.pop(email_id, None)
+            if outer:
+                outer.set_result(self._queued_record(email_id))
+            return
+
+        with self._cond:
+            self.queue.done(email_id)
+            self._finished[email_id] = record
+            outer = self._futures.pop(email_id, None)
+        if self.on_result:
+            self.on_result(email_id, record)
+        if outer:
+            outer.set_result(record)
+
+    def close(self, wait=False, cancelled=None, on_wait=None, on_tick=None):
+        """Stop taking emails and send what the quota allows.
+
+        With wait, keep sending through as many quota windows as it takes,
+        until the queue is empty or cancelled() returns True. on_wait(until)
+        is called from this thread whenever sending pauses for the quota, and
+        on_tick() about once a second until sending stops.
+        Emails left unsent resolve to records with 'queued': True.
+        """
+        with self._cond:
+            self._closing = True
+            self._wait_for_window = wait
+            self._cond.notify()
+
+        reported = None
+        while self._thread.is_alive():
+            self._thread.join(1.0)
+            if on_tick:
+                on_tick()
+            if on_wait and self.waiting_until != reported:
+                reported = self.waiting_until
+                if reported:
+                    on_wait(reported)
+            if wait and cancelled and cancelled():
+                with self._cond:
+                    self._wait_for_window = False
+                    self._cond.notify()
+
+        # Sends in flight still complete through the dispatcher; any the
+        # script rejects for quota from now on are reported as queued
+        with self._cond:
+            self._closed = True
+            left = [(email_id, self._futures.pop(email_id)) for email_id in self._ready
+                    if email_id in self._futures]
+        for email_id, future in left:
+            future.set_result(self._queued_record(email_id))
+
+    def _queued_record(self, email_id):
+        """Result record of an email left in the queue"""
+        email, _, _, pdf_path, recipient_name = self.queue.pending[email_id]
+        until = self.queue.opens_at(time.time(), self.daily_quota)
+        return {
+            'email': email, 'name': recipient_name, 'pdf_path': pdf_path,
+            'success': False, 'queued': True,
+            'message': "Queued until the email quota frees up "
+                       f"({datetime.fromtimestamp(until):%Y-%m-%d %H:%M})",
+            'attempts': 0, 'status_code': None,
+        }
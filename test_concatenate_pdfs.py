@@ -0,0 +1,36 @@
+"""concatenate_pdfs joins ReportLab documents page by page."""
+from PIL import Image
+from PyPDF2 import PdfReader
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from certificate_engine import concatenate_pdfs
+
+
+def write_part(path, names, template):
+    c = canvas.Canvas(str(path), pagesize=(200, 100))
+    for name in names:
+        c.drawImage(template, 0, 0, 200, 100)
+        c.drawString(10, 50, name)
+        c.linkURL(f"https://example.com/{name}", (0, 0, 50, 20), relative=0)
+        c.showPage()
+    c.save()
+
+
+def test_pages_keep_their_order_text_and_links(tmp_path):
+    template = ImageReader(Image.new("RGB", (20, 10), "navy"))
+    parts = []
+    for part, names in enumerate((["Ada", "Grace"], ["Alan"], ["Edsger", "Barbara"])):
+        parts.append(tmp_path / f"part{part}.pdf")
+        write_part(parts[-1], names, template)
+
+    merged = tmp_path / "merged.pdf"
+    concatenate_pdfs(parts, merged)
+
+    pages = PdfReader(merged, strict=True).pages
+    assert [page.extract_text().strip() for page in pages] == [
+        "Ada", "Grace", "Alan", "Edsger", "Barbara"]
+    assert pages[4]['/Annots'][0].get_object()['/A']['/URI'] == "https://example.com/Barbara"
+    # Pages of one part still share its template image
+    images = [[ref.idnum for ref in page['/Resources']['/XObject'].values()] for page in pages]
+    assert images[0] == images[1] != images[2]
@@ -0,0 +1,61 @@
+"""Streamed rosters read like a full read_excel/read_csv of the same file."""
+import openpyxl
+import pandas as pd
+from PIL import Image
+
+from certificate_engine import CertificateEngine, iter_data_file, preflight_report, read_data_file
+
+
+def write_roster(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Name", "UID", "Email"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def engine():
+    layout = {
+        'template_path': None,
+        'text_fields': [{'id': 0, 'type': 'Name', 'csv_column': 'Name', 'font_path': None,
+                         'font_size': 20, 'font_color': '#000000', 'position': (200, 100)}],
+        'verification': {'enabled': True, 'uid_column': 'UID', 'position': (200, 200),
+                         'font_size': 12},
+        'email': {'enabled': True, 'email_column': 'Email'},
+    }
+    return CertificateEngine(layout, Image.new("RGB", (400, 300), "white"))
+
+
+def test_blank_xlsx_column_is_missing_not_none(tmp_path):
+    path = str(tmp_path / "roster.xlsx")
+    write_roster(path, [["Ada", None, None], ["Alan", None, None], ["Grace"]])
+    certificates = engine()
+
+    chunks = list(iter_data_file(path, chunksize=2))
+    assert all(chunk[['UID', 'Email']].isna().all().all() for chunk in chunks)
+
+    report = certificates.preflight(iter_data_file(path, chunksize=2))
+    assert report == certificates.preflight(read_data_file(path))
+    assert [row for row, _ in report['missing_uids']] == [1, 2, 3]
+    assert [(row, email) for row, _, email in report['invalid_emails']] == [(1, ''), (2, ''),
+                                                                            (3, '')]
+
+    for chunk in chunks:
+        for prepared, (_, row) in zip(certificates.prepare_chunk(chunk), chunk.iterrows()):
+            assert prepared.uid is None
+            assert certificates.get_uid(row, chunk.columns) is None
+            texts, links = certificates.layout_row(row, chunk.columns, prepared)[:2]
+            assert not any("Verification ID" in text for _, text, _, _ in texts)
+            assert not links
+
+
+def test_checked_chunks_report_matches_a_full_preflight(tmp_path):
+    path = str(tmp_path / "roster.xlsx")
+    write_roster(path, [["Ada", "U1", "ada@example.com"], ["Alan", None, "alan"], [None, "U3"]])
+    certificates = engine()
+    report = preflight_report()
+    chunks = list(certificates.checked_chunks(iter_data_file(path, chunksize=2), report))
+    assert sum(len(chunk) for chunk in chunks) == 3
+    assert report == certificates.preflight(read_data_file(path))
+    assert report['rows'] == 3 and report['empty_fields'] == {'Name': 1}
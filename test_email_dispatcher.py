@@ -0,0 +1,115 @@
+"""EmailDispatcher against a local stand-in for the Apps Script web app."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from certificate_email import EmailDispatcher
+
+
+class AppsScript(BaseHTTPRequestHandler):
+    """Sends every email it is given, then answers as the server's script says"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        emails = body['batch'] if 'batch' in body else [body]
+        status, delay = self.server.script.pop(0) if self.server.script else (200, 0)
+        if status == 200:
+            self.server.sent.extend(email['to'] for email in emails)
+        time.sleep(delay)
+        if 'batch' in body:
+            answer = {'success': True, 'results': [{'success': True}] * len(emails)}
+        else:
+            answer = {'success': True}
+        data = json.dumps(answer if status == 200 else {'error': "Unavailable"}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except OSError:
+            pass  # the client gave up waiting
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # last_apps_script_response.txt
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AppsScript)
+    server.script = []  # (status, seconds before answering) per request
+    server.sent = []
+    server.url = f"http://127.0.0.1:{server.server_port}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "Ada.pdf"
+    path.write_bytes(b"%PDF-1.4 certificate")
+    return str(path)
+
+
+def test_sends_each_email_once(server, pdf_path):
+    with EmailDispatcher(server.url, backoff=0) as dispatcher:
+        futures = [dispatcher.submit(f"r{i}@example.com", "Subject", "Hi {Name}", pdf_path, "Ada")
+                   for i in range(5)]
+        records = [future.result() for future in futures]
+    assert all(record['success'] and record['attempts'] == 1 for record in records)
+    assert sorted(server.sent) == [f"r{i}@example.com" for i in range(5)]
+
+
+def test_retries_when_the_script_is_unavailable(server, pdf_path):
+    server.script = [(503, 0), (429, 0)]
+    with EmailDispatcher(server.url, backoff=0) as dispatcher:
+        record = dispatcher.send("ada@example.com", "Subject", "Hi", pdf_path, "Ada")
+    assert record['success'] and record['attempts'] == 3
+    assert server.sent == ["ada@example.com"]
+
+
+def test_server_error_is_not_retried(server, pdf_path):
+    server.script = [(500, 0)]
+    with EmailDispatcher(server.url, backoff=0) as dispatcher:
+        record = dispatcher.send("ada@example.com", "Subject", "Hi", pdf_path, "Ada")
+    assert not record['success'] and record['attempts'] == 1
+    assert record['status_code'] == 500
+
+
+def test_read_timeout_is_not_retried(server, pdf_path):
+    # The script sends the email, then answers too late
+    server.script = [(200, 1.5)] * 3
+    with EmailDispatcher(server.url, backoff=0, timeout=0.5, max_retries=2) as dispatcher:
+        record = dispatcher.send("ada@example.com", "Subject", "Hi", pdf_path, "Ada")
+    assert not record['success'] and record['attempts'] == 1
+    assert "may have been sent" in record['message']
+    assert server.sent == ["ada@example.com"]
+
+
+def test_batch_is_not_resent_after_a_read_timeout(server, pdf_path):
+    server.script = [(200, 1.5)] * 3
+    with EmailDispatcher(server.url, backoff=0, max_retries=2, batch_size=3) as dispatcher:
+        # A batch of n waits timeout + 5 * n seconds: make that 1
+        dispatcher.timeout = 1.0 - 5 * 3
+        records = dispatcher.send_batch([(f"r{i}@example.com", "Subject", "Hi", pdf_path, "Ada")
+                                         for i in range(3)])
+    assert [record['attempts'] for record in records] == [1, 1, 1]
+    assert not any(record['success'] for record in records)
+    assert len(server.sent) == 3
+
+
+def test_connection_errors_are_retried(pdf_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AppsScript)
+    url = f"http://127.0.0.1:{server.server_port}/"
+    server.server_close()  # nothing listens there any more
+    with EmailDispatcher(url, backoff=0, max_retries=2) as dispatcher:
+        record = dispatcher.send("ada@example.com", "Subject", "Hi", pdf_path, "Ada")
+    assert not record['success'] and record['attempts'] == 3
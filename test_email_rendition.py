@@ -0,0 +1,52 @@
+"""The email rendition is downsampled to the attachment DPI."""
+import os
+
+import pandas as pd
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader
+
+from certificate_engine import EMAIL_RENDITION_FOLDER, CertificateEngine
+
+
+def layout(attachment_dpi, file_format='pdf', page_size='template', dpi=None):
+    return {
+        'template_path': None,
+        'text_fields': [{'id': 0, 'type': 'Name', 'csv_column': 'Name', 'font_path': None,
+                         'font_size': 60, 'font_color': '#000000', 'position': (1700, 1200)}],
+        'verification': {'enabled': False},
+        'email': {'enabled': True, 'email_column': 'Email', 'subject': "Certificate",
+                  'message': "Hi {Name}", 'attachment_dpi': attachment_dpi},
+        'output': {'file_format': file_format, 'page_size': page_size, 'dpi': dpi},
+    }
+
+
+def attachment_width(output_folder, file_format):
+    folder = os.path.join(output_folder, EMAIL_RENDITION_FOLDER)
+    path = os.path.join(folder, os.listdir(folder)[0])
+    if file_format != 'pdf':
+        return Image.open(path).size[0]
+    image, = PdfReader(path).pages[0]['/Resources']['/XObject'].values()
+    return image.get_object()['/Width']
+
+
+@pytest.mark.parametrize('template_dpi, settings, width', [
+    # A template page is drawn at one point per pixel but printed at the template's DPI
+    (None, {'attachment_dpi': 150}, 1754),
+    (None, {'attachment_dpi': 100}, 1169),
+    (600, {'attachment_dpi': 150}, 877),
+    (None, {'attachment_dpi': 150, 'file_format': 'png'}, 1754),
+    # On top of an already downsampled render
+    (None, {'attachment_dpi': 100, 'dpi': 150}, 1169),
+    (None, {'attachment_dpi': 100, 'page_size': 'A4'}, 1169),
+    # Never upsampled
+    (None, {'attachment_dpi': 600}, 3508),
+])
+def test_attachment_pixel_size(tmp_path, template_dpi, settings, width):
+    template = Image.new("RGB", (3508, 2480), "white")
+    if template_dpi:
+        template.info['dpi'] = (template_dpi, template_dpi)
+    engine = CertificateEngine(layout(**settings), template)
+    data = pd.DataFrame({'Name': ["Ada Lovelace"], 'Email': ["ada@example.com"]})
+    engine.run(data, str(tmp_path), email_sender=lambda *args: (True, "Sent"))
+    assert attachment_width(str(tmp_path), settings.get('file_format', 'pdf')) == width
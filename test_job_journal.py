@@ -0,0 +1,35 @@
+"""JobJournal keeps what a job rendered and sent across reopenings."""
+import pandas as pd
+
+from certificate_journal import JobJournal
+
+
+def test_journal_opened_without_a_job_key_is_appended_to(tmp_path):
+    row = pd.Series({'Name': "Ada", 'Email': "ada@example.com"})
+    other = pd.Series({'Name': "Alan", 'Email': "alan@example.com"})
+    journal = JobJournal(tmp_path, "job-a")
+    journal.record_render(0, row, (str(tmp_path / "Ada.pdf"), "Ada", "Ada"))
+    journal.record_email(0, row, {'success': True, 'message': "Sent"})
+    journal.close()
+
+    # Sending queued emails under another layout must not reset the journal
+    journal = JobJournal(tmp_path, None)
+    assert journal.job_key == "job-a"
+    journal.record_email_id(JobJournal.email_id(1, other), {'success': True, 'message': "Sent"})
+    journal.close()
+
+    journal = JobJournal(tmp_path, "job-a")
+    assert journal.email_sent(0, row) and journal.email_sent(1, other)
+    assert len(journal.rendered) == 1
+    journal.close()
+
+
+def test_journal_of_another_job_starts_fresh(tmp_path):
+    row = pd.Series({'Name': "Ada"})
+    journal = JobJournal(tmp_path, "job-a")
+    journal.record_email(0, row, {'success': True, 'message': "Sent"})
+    journal.close()
+
+    journal = JobJournal(tmp_path, "job-b")
+    assert not journal.email_sent(0, row)
+    journal.close()
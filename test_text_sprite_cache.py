@@ -0,0 +1,28 @@
+"""TextSpriteCache stays bounded however it is used."""
+from PIL import Image, ImageDraw
+
+from certificate_engine import TEXT_SPRITE_ENTRY_BYTES, TextSpriteCache, load_font
+
+
+def test_measure_only_entries_are_evicted():
+    # Vector pages only measure text, so entries never get a mask
+    max_bytes = 100 * (TEXT_SPRITE_ENTRY_BYTES + 16)
+    cache = TextSpriteCache(max_bytes=max_bytes)
+    font = load_font(None, 20)
+    for i in range(10000):
+        cache.size(f"Participant {i:06d}", font)
+    assert len(cache) <= 100
+    assert cache._bytes <= max_bytes
+
+
+def test_drawing_matches_draw_text_after_eviction():
+    cache = TextSpriteCache(max_bytes=4 * (TEXT_SPRITE_ENTRY_BYTES + 16))
+    font = load_font(None, 20)
+    for i in range(50):
+        text = f"Row {i}"
+        expected = Image.new("RGB", (200, 60), "white")
+        ImageDraw.Draw(expected).text((10, 10), text, fill="#123456", font=font)
+        image = Image.new("RGB", (200, 60), "white")
+        cache.draw(image, (10, 10), text, "#123456", font)
+        assert image.tobytes() == expected.tobytes()
+    assert len(cache) <= 4